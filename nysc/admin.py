@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.utils import timezone
 from .models import UserProfile, LeaderboardReset, LeaderboardEntry, Follow, EmailVerificationToken, PPA, PPAReview, Notification, MarketplaceSubscription, MarketplaceFeedback, UserBookmark
+from .featured import invalidate_featured_ppas
+from .utils import bump_catalog_version
+from .page_cache import bump_page_cache_tags
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
 
@@ -76,14 +79,20 @@ class CustomUserAdmin(UserAdmin):
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
 
+def _catalog_changed():
+    # Bulk actions use queryset.update(), which sends no signals and skips auto_now, so they set updated_at themselves
+    invalidate_featured_ppas()
+    bump_catalog_version()
+    bump_page_cache_tags('ppa')
+
 # Existing PPA Admin with Pytesseract status check
 @admin.register(PPA)
 class PPAAdmin(admin.ModelAdmin):
     list_display = ('name', 'state', 'lga', 'sector', 'stipend', 'accommodation_available', 'is_approved', 'verified', 'verification_status', 'posted_by', 'created_at')
-    list_filter = ('state', 'sector', 'is_approved', 'verified', 'verification_status', 'accommodation_available', 'created_at')
+    list_filter = ('state', 'sector', 'is_approved', 'verified', 'verification_status', 'verification_ocr_status', 'accommodation_available', 'created_at')
     search_fields = ('name', 'state', 'lga', 'description', 'address')
     list_editable = ('is_approved', 'verified', 'verification_status')
-    readonly_fields = ('created_at', 'verification_document')
+    readonly_fields = ('created_at', 'verification_document', 'verification_ocr_status')
     fieldsets = (
         (None, {
             'fields': ('name', 'posted_by', 'is_approved', 'verified', 'verification_status')
@@ -95,7 +104,7 @@ class PPAAdmin(admin.ModelAdmin):
             'fields': ('sector', 'stipend', 'accommodation_available', 'description', 'contact', 'image')
         }),
         ('Verification', {
-            'fields': ('verification_document',)
+            'fields': ('verification_document', 'verification_ocr_status')
         }),
         ('Metadata', {
             'fields': ('created_at',)
@@ -104,22 +113,26 @@ class PPAAdmin(admin.ModelAdmin):
     actions = ['approve_ppas', 'reject_ppas', 'verify_ppas', 'reject_verification', 'check_pytesseract_status']
 
     def approve_ppas(self, request, queryset):
-        queryset.update(is_approved=True)
+        queryset.update(is_approved=True, updated_at=timezone.now())
+        _catalog_changed()
         self.message_user(request, "Selected PPAs have been approved.")
     approve_ppas.short_description = "Approve selected PPAs"
 
     def reject_ppas(self, request, queryset):
-        queryset.update(is_approved=False)
+        queryset.update(is_approved=False, updated_at=timezone.now())
+        _catalog_changed()
         self.message_user(request, "Selected PPAs have been rejected.")
     reject_ppas.short_description = "Reject selected PPAs"
 
     def verify_ppas(self, request, queryset):
-        queryset.update(verified=True, verification_status='approved')
+        queryset.update(verified=True, verification_status='approved', updated_at=timezone.now())
+        _catalog_changed()
         self.message_user(request, "Selected PPAs have been verified.")
     verify_ppas.short_description = "Verify selected PPAs"
 
     def reject_verification(self, request, queryset):
-        queryset.update(verified=False, verification_status='rejected')
+        queryset.update(verified=False, verification_status='rejected', updated_at=timezone.now())
+        _catalog_changed()
         self.message_user(request, "Verification for selected PPAs has been rejected.")
     reject_verification.short_description = "Reject verification"
 
@@ -0,0 +1,17 @@
+from django.utils.functional import SimpleLazyObject
+
+
+def get_bookmarked_ppa_ids(request):
+    """Set of PPA ids the current user has bookmarked, fetched at most once per request."""
+    if not hasattr(request, '_bookmarked_ppa_ids'):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            request._bookmarked_ppa_ids = frozenset(user.bookmarks.values_list('ppa_id', flat=True))
+        else:
+            request._bookmarked_ppa_ids = frozenset()
+    return request._bookmarked_ppa_ids
+
+
+def bookmarks(request):
+    # Lazy so pages without bookmark buttons never run the query
+    return {'bookmarked_ppa_ids': SimpleLazyObject(lambda: get_bookmarked_ppa_ids(request))}
@@ -0,0 +1,145 @@
+from collections import Counter, defaultdict, namedtuple
+from .models import PPA
+from .utils import CatalogIndex, normalize_text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Weighted Jaccard over trigram sets; the name says more about identity than the address does
+NAME_WEIGHT = 0.6
+ADDRESS_WEIGHT = 0.4
+MATCH_THRESHOLD = 0.45
+MAX_MATCHES = 5
+
+DuplicateMatch = namedtuple('DuplicateMatch', 'id name address state lga posted_by_id score exact')
+
+
+def trigrams(key):
+    """Trigrams of each word padded like pg_trgm ('  ab ' -> '  a', ' ab', 'ab '), so short words still count."""
+    grams = set()
+    for word in key.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _scope(state, lga):
+    return (state or '', normalize_text(lga))
+
+
+class _Scope:
+    __slots__ = ('name_postings', 'address_postings')
+
+    def __init__(self):
+        self.name_postings = defaultdict(set)
+        self.address_postings = defaultdict(set)
+
+
+class DuplicateIndex:
+    """
+    Trigram postings for every PPA's normalized name and address, partitioned by (state, LGA).
+    A lookup counts shared trigrams straight off the posting lists, which gives each candidate's
+    intersection size and hence its Jaccard score without touching rows that share nothing.
+    """
+
+    def __init__(self, rows=(), version=None):
+        self.version = version
+        self.scopes = defaultdict(_Scope)
+        self.entries = {}
+        self.exact = defaultdict(set)
+        for row in rows:
+            self.add(*row)
+
+    @classmethod
+    def build(cls, version=None):
+        rows = PPA.objects.values_list(
+            'id', 'name', 'address', 'name_key', 'address_key', 'state', 'lga', 'posted_by_id'
+        ).iterator(chunk_size=2000)
+        index = cls(rows, version=version)
+        logger.info(f"Built duplicate index over {len(index.entries)} PPAs (catalog version {version})")
+        return index
+
+    def add(self, ppa_id, name, address, name_key, address_key, state, lga, posted_by_id):
+        self.remove(ppa_id)
+        scope_key = _scope(state, lga)
+        name_grams, address_grams = trigrams(name_key), trigrams(address_key)
+        scope = self.scopes[scope_key]
+        for gram in name_grams:
+            scope.name_postings[gram].add(ppa_id)
+        for gram in address_grams:
+            scope.address_postings[gram].add(ppa_id)
+        self.exact[(name_key, address_key)].add(ppa_id)
+        self.entries[ppa_id] = (name, address, name_key, address_key, state, lga, posted_by_id,
+                                scope_key, len(name_grams), len(address_grams))
+
+    def remove(self, ppa_id):
+        entry = self.entries.pop(ppa_id, None)
+        if entry is None:
+            return
+        name_key, address_key, scope_key = entry[2], entry[3], entry[7]
+        scope = self.scopes[scope_key]
+        for gram in trigrams(name_key):
+            scope.name_postings[gram].discard(ppa_id)
+        for gram in trigrams(address_key):
+            scope.address_postings[gram].discard(ppa_id)
+        self.exact[(name_key, address_key)].discard(ppa_id)
+
+    def update(self, ppa_id, ppa):
+        if ppa is None:
+            self.remove(ppa_id)
+        else:
+            self.add(ppa_id, ppa.name, ppa.address, ppa.name_key, ppa.address_key,
+                     ppa.state, ppa.lga, ppa.posted_by_id)
+
+    def _scopes_for(self, state, lga):
+        if state and normalize_text(lga):
+            scope = self.scopes.get(_scope(state, lga))
+            return [scope] if scope else []
+        # list() snapshots the dict; apply() may add scopes concurrently
+        return [scope for (scope_state, _), scope in list(self.scopes.items()) if not state or scope_state == state]
+
+    def _match(self, ppa_id, score, exact):
+        name, address, _, _, state, lga, posted_by_id = self.entries[ppa_id][:7]
+        return DuplicateMatch(ppa_id, name, address, state, lga, posted_by_id, round(score, 3), exact)
+
+    def find(self, name, address, state=None, lga=None, limit=MAX_MATCHES, threshold=MATCH_THRESHOLD, exclude_id=None):
+        """
+        Ranked near-duplicates of a name/address within the state and LGA (or the whole catalogue
+        when they are blank). Exact normalized matches always come back, whatever their location,
+        since name+address is unique across the catalogue.
+        """
+        name_key, address_key = normalize_text(name), normalize_text(address)
+        exact_ids = set(self.exact.get((name_key, address_key), ())) - {exclude_id}
+        scores = {ppa_id: 1.0 for ppa_id in exact_ids if ppa_id in self.entries}
+
+        name_grams, address_grams = trigrams(name_key), trigrams(address_key)
+        if name_grams:
+            for scope in self._scopes_for(state, lga):
+                name_hits = Counter()
+                for gram in name_grams:
+                    name_hits.update(scope.name_postings.get(gram, ()))
+                address_hits = Counter()
+                for gram in address_grams:
+                    address_hits.update(scope.address_postings.get(gram, ()))
+                for ppa_id, shared in name_hits.items():
+                    if ppa_id in scores or ppa_id == exclude_id:
+                        continue
+                    entry = self.entries.get(ppa_id)
+                    if entry is None:
+                        continue
+                    name_score = shared / (len(name_grams) + entry[8] - shared)
+                    address_union = len(address_grams) + entry[9] - address_hits[ppa_id]
+                    address_score = address_hits[ppa_id] / address_union if address_union else 0.0
+                    score = NAME_WEIGHT * name_score + ADDRESS_WEIGHT * address_score
+                    if score >= threshold:
+                        scores[ppa_id] = score
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]
+        return [self._match(ppa_id, score, ppa_id in exact_ids) for ppa_id, score in ranked]
+
+
+_duplicate_index = CatalogIndex(DuplicateIndex.build)
+
+
+def find_duplicate_ppas(name, address, state=None, lga=None, **kwargs):
+    return _duplicate_index.get().find(name, address, state, lga, **kwargs)
@@ -0,0 +1,127 @@
+from collections import defaultdict
+from .models import PPA
+from .utils import CatalogIndex, normalize_text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Stipend bands are cumulative, matching the finder's min_stipend (stipend >= threshold) filter
+STIPEND_BANDS = ('100000', '50000', '20000')
+ACCOMMODATION_VALUES = {True: 'yes', False: 'no'}
+FACET_FIELDS = ('state', 'lga', 'sector', 'min_stipend', 'accommodation')
+
+
+def _facet_values(state, lga, sector, stipend, accommodation_available):
+    values = {
+        'state': [state],
+        'lga': [normalize_text(lga)],
+        'sector': [sector],
+        'min_stipend': [band for band in STIPEND_BANDS if stipend is not None and stipend >= int(band)],
+        'accommodation': [],
+    }
+    if accommodation_available in ACCOMMODATION_VALUES:
+        values['accommodation'].append(ACCOMMODATION_VALUES[accommodation_available])
+    return values
+
+
+def selected_facets(applied):
+    """Map the filters a listing applied (PPASearchForm.filter_queryset's signature) onto facet values."""
+    selected = {field: applied[field] for field in ('state', 'lga', 'sector') if applied.get(field)}
+    if applied.get('min_stipend'):
+        selected['min_stipend'] = str(applied['min_stipend'])
+    if applied.get('accommodation') is not None:
+        selected['accommodation'] = ACCOMMODATION_VALUES[applied['accommodation']]
+    return selected
+
+
+class FacetIndex:
+    """
+    Approved PPAs as one bitset (a Python int, bit n = PPA id n) per facet value. Filtered counts
+    are popcounts of bitset intersections, so no GROUP BY runs per request.
+    """
+
+    def __init__(self, rows=(), version=None):
+        self.version = version
+        self.members = {}
+        # Collect ids first: OR-ing bits into big ints row by row would copy each bitset per row
+        ids_by_value = {field: defaultdict(list) for field in FACET_FIELDS}
+        for ppa_id, *fields in rows:
+            values = _facet_values(*fields)
+            self.members[ppa_id] = values
+            for field, field_values in values.items():
+                for value in field_values:
+                    ids_by_value[field][value].append(ppa_id)
+        self.all = ids_to_bitset(self.members)
+        self.bits = {
+            field: defaultdict(int, {value: ids_to_bitset(ids) for value, ids in by_value.items()})
+            for field, by_value in ids_by_value.items()
+        }
+
+    @classmethod
+    def build(cls, version=None):
+        rows = PPA.objects.filter(is_approved=True).values_list(
+            'id', 'state', 'lga', 'sector', 'stipend', 'accommodation_available'
+        ).iterator(chunk_size=2000)
+        index = cls(rows, version=version)
+        logger.info(f"Built facet index over {index.all.bit_count()} approved PPAs (catalog version {version})")
+        return index
+
+    def add(self, ppa_id, *fields):
+        self.remove(ppa_id)
+        bit = 1 << ppa_id
+        values = _facet_values(*fields)
+        for field, field_values in values.items():
+            for value in field_values:
+                self.bits[field][value] |= bit
+        self.all |= bit
+        self.members[ppa_id] = values
+
+    def remove(self, ppa_id):
+        values = self.members.pop(ppa_id, None)
+        if values is None:
+            return
+        mask = ~(1 << ppa_id)
+        for field, field_values in values.items():
+            for value in field_values:
+                self.bits[field][value] &= mask
+        self.all &= mask
+
+    def update(self, ppa_id, ppa):
+        if ppa is not None and ppa.is_approved:
+            self.add(ppa_id, ppa.state, ppa.lga, ppa.sector, ppa.stipend, ppa.accommodation_available)
+        else:
+            self.remove(ppa_id)
+
+    def counts(self, selected, restrict_to=None):
+        """
+        Disjunctive facet counts: each facet is counted against every *other* selected filter, so a
+        chosen state still shows the counts the other states would give.
+        """
+        base = self.all if restrict_to is None else self.all & restrict_to
+        masks = {field: self.bits[field].get(value, 0) for field, value in selected.items() if value}
+        results = {}
+        for field in FACET_FIELDS:
+            scope = base
+            for other, mask in masks.items():
+                if other != field:
+                    scope &= mask
+            # list() snapshots the dict in one step; apply() may add values concurrently
+            results[field] = {value: (bits & scope).bit_count() for value, bits in list(self.bits[field].items())}
+        return results
+
+
+_facet_index = CatalogIndex(FacetIndex.build)
+
+
+def get_facet_index():
+    return _facet_index.get()
+
+
+def ids_to_bitset(ids):
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for ppa_id in ids:
+        buffer[ppa_id >> 3] |= 1 << (ppa_id & 7)
+    return int.from_bytes(buffer, 'little')
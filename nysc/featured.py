@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.text import slugify
+from .models import PPA
+import logging
+
+logger = logging.getLogger(__name__)
+
+FEATURED_COUNT = 3
+FEATURED_MIN_RATING = 4
+FEATURED_CACHE_PREFIX = 'featured_ppas'
+
+
+def _cache_key(state=None):
+    return f"{FEATURED_CACHE_PREFIX}:{slugify(state) if state else 'all'}"
+
+
+def _all_cache_keys():
+    return [_cache_key()] + [_cache_key(state) for state, _ in PPA.state.field.choices]
+
+
+def compute_featured_ppas(state=None):
+    queryset = PPA.objects.filter(is_approved=True, avg_rating__gte=FEATURED_MIN_RATING)
+    if state:
+        queryset = queryset.filter(state=state)
+    return list(
+        queryset.select_related('posted_by__profile').order_by('-avg_rating', '-review_count', '-id')[:FEATURED_COUNT]
+    )
+
+
+def get_featured_ppas(state=None):
+    """Top-rated approved PPAs, per state when given, topped up from the national list."""
+    if state and state not in dict(PPA.state.field.choices):
+        state = None
+    key = _cache_key(state)
+    featured = cache.get(key)
+    if featured is None:
+        featured = compute_featured_ppas(state)
+        if state and len(featured) < FEATURED_COUNT:
+            seen = {ppa.id for ppa in featured}
+            featured += [ppa for ppa in get_featured_ppas() if ppa.id not in seen][:FEATURED_COUNT - len(featured)]
+        cache.set(key, featured, timeout=getattr(settings, 'FEATURED_PPAS_CACHE_TIMEOUT', 3600))
+        logger.debug(f"Computed featured PPAs for {key}: {[ppa.id for ppa in featured]}")
+    return featured
+
+
+def invalidate_featured_ppas():
+    cache.delete_many(_all_cache_keys())
+    logger.debug("Invalidated featured PPA cache")
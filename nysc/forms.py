@@ -4,12 +4,13 @@ from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from .models import PPA, PPAReview, UserProfile
 import requests
-from PIL import Image
-from io import BytesIO
-from django.core.files.uploadedfile import InMemoryUploadedFile
-import sys
 import re
-from .utils import lgasData
+from .utils import lgasData, normalize_text
+from .search import query_terms, search_ppas
+from .images import avatar_for
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 
@@ -64,6 +65,12 @@ class ProfileForm(forms.ModelForm):
 
 
 class PPASearchForm(forms.Form):
+    q = forms.CharField(
+        required=False,
+        max_length=100,
+        label='Search',
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Name, address, LGA or description', 'type': 'search'})
+    )
     state = forms.ChoiceField(
         choices=[('', 'All States')] + list(PPA.state.field.choices),
         required=False,
@@ -112,6 +119,61 @@ class PPASearchForm(forms.Form):
         else:
             self.fields['lga'].choices = [('', 'All LGAs')]
 
+    def filter_queryset(self, queryset):
+        """
+        Apply the validated filters to a PPA queryset. Returns the filtered queryset and a dict of
+        the filters actually applied, normalized, for use as a cache signature.
+        """
+        data = self.cleaned_data
+        applied = {}
+        state = data.get('state')
+        lga = data.get('lga')
+        sector = data.get('sector')
+        min_stipend = data.get('min_stipend')
+        accommodation = data.get('accommodation')
+        q = data.get('q')
+        logger.debug(f"Form data: q={q}, state={state}, lga={lga}, sector={sector}, min_stipend={min_stipend}, accommodation={accommodation}")
+
+        if state:
+            queryset = queryset.filter(state=state)
+            applied['state'] = state
+            logger.debug(f"Applied state filter: {state}")
+            if lga and state in lgasData and lga in lgasData[state]:
+                queryset = queryset.filter(lga_key=normalize_text(lga))
+                applied['lga'] = normalize_text(lga)
+                logger.debug(f"Applied lga filter: {lga} for state {state}")
+        if sector:
+            queryset = queryset.filter(sector=sector)
+            applied['sector'] = sector
+            logger.debug(f"Applied sector filter: {sector}")
+        if min_stipend:
+            stipend_threshold = int(min_stipend)
+            queryset = queryset.filter(stipend__gte=stipend_threshold)
+            applied['min_stipend'] = stipend_threshold
+            logger.debug(f"Applied min_stipend filter: >= {stipend_threshold}")
+        if accommodation in ('yes', 'no'):
+            queryset = queryset.filter(accommodation_available=accommodation == 'yes')
+            applied['accommodation'] = accommodation == 'yes'
+            logger.debug(f"Applied accommodation filter: {accommodation}")
+        if query_terms(q):
+            # Ranked by BM25 relevance instead of recency
+            queryset = search_ppas(queryset, q)
+            applied['q'] = query_terms(q)
+            logger.debug(f"Applied text search: {q}")
+        return queryset, applied
+
+    def apply_facet_counts(self, counts):
+        """Relabel choices with result counts, e.g. "Lagos (1,204)"."""
+        for name, field_counts in counts.items():
+            field_choices = []
+            for value, label in self.fields[name].choices:
+                if value:
+                    # LGA facets are keyed by normalized name
+                    key = normalize_text(value) if name == 'lga' else value
+                    label = f"{label} ({field_counts.get(key, 0):,})"
+                field_choices.append((value, label))
+            self.fields[name].choices = field_choices
+
 
 
 
@@ -188,60 +250,14 @@ class PPASubmissionForm(forms.ModelForm):
             return False
         return None  # For 'Not Sure' or empty
 
-    def clean_image(self):
-        image = self.cleaned_data.get('image')
-        if image:
-            try:
-                img = Image.open(image)
-                img = img.convert('RGB')
-                max_size = (800, 800)
-                img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                output = BytesIO()
-                img.save(output, format='JPEG', quality=70, optimize=True)
-                output.seek(0)
-                compressed_image = InMemoryUploadedFile(
-                    output,
-                    'ImageField',
-                    f"{image.name.rsplit('.', 1)[0]}_compressed.jpg",
-                    'image/jpeg',
-                    sys.getsizeof(output),
-                    None
-                )
-                print(f"Compressed image: {compressed_image.name}, size: {compressed_image.size} bytes")
-                return compressed_image
-            except Exception as e:
-                print(f"Image compression error: {e}")
-                raise forms.ValidationError("Invalid image file.")
-        return image
-
     def save(self, *args, **kwargs):
         instance = super().save(commit=False)
-        # Handle default avatar if no image is uploaded
         if not self.cleaned_data.get('image'):
-            name = self.cleaned_data.get('name', 'PPA')
-            first_letter = name[0].upper() if name else 'P'
-            # Generate a simple avatar (this is a placeholder; you might want to use a library like Pillow)
-            from django.core.files.base import ContentFile
-            from io import BytesIO
-            from PIL import Image, ImageDraw, ImageFont
-
-            # Create a square image
-            size = (200, 200)
-            image = Image.new('RGB', size, color=(108, 117, 125))  # Default gray color from your CSS
-            draw = ImageDraw.Draw(image)
+            # Image-less PPAs all reference one shared avatar per leading letter or digit
             try:
-                font = ImageFont.load_default()  # Use default font; consider adding a custom font
-                text_size = draw.textlength(first_letter, font=font)
-                position = ((size[0] - text_size) / 2, (size[1] - font.size) / 2)
-                draw.text(position, first_letter, fill=(248, 249, 250), font=font)  # White text
-                output = BytesIO()
-                image.save(output, format='JPEG', quality=70)
-                output.seek(0)
-                instance.image.save(f'{name}_avatar.jpg', ContentFile(output.read()), save=False)
+                instance.image = avatar_for(self.cleaned_data.get('name'))
             except Exception as e:
-                print(f"Avatar generation error: {e}")
-                # Fallback to no image if generation fails
-                pass
+                logger.error(f"Letter avatar lookup failed: {str(e)}")
         return super().save(*args, **kwargs)
     
 
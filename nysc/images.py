@@ -0,0 +1,428 @@
+from io import BytesIO
+import functools
+import hashlib
+import os
+import tempfile
+import threading
+from background_task import background
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from PIL import ExifTags, Image, ImageOps
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PENDING = 'processing'
+IMAGE_READY = 'ready'
+IMAGE_FAILED = 'failed'
+IMAGE_STATUS_CHOICES = [
+    (IMAGE_PENDING, 'Processing'),
+    (IMAGE_READY, 'Ready'),
+    (IMAGE_FAILED, 'Failed'),
+]
+
+# Uploads are kept as a bounded master; display sizes are cut from it on first request by the
+# /media/thumb/<w>x<h>/ endpoint and cached on disk (see get_thumbnail)
+PPA_IMAGE_SIZE = (1280, 1280)
+PPA_IMAGE_RATIO = 3 / 2
+PROFILE_PICTURE_SIZE = (600, 600)
+
+# Responsive widths offered in srcsets, and the thumbnail box each one maps to. Only these boxes
+# are served, so the disk cache cannot be filled with arbitrary sizes.
+PPA_IMAGE_WIDTHS = (320, 640, 960)
+PROFILE_PICTURE_WIDTHS = (64, 160, 320, 600)
+THUMBNAIL_BOXES = {
+    'ppa_images/': {width: (width, round(width / PPA_IMAGE_RATIO)) for width in PPA_IMAGE_WIDTHS},
+    'profile_pics/': {width: (width, width) for width in PROFILE_PICTURE_WIDTHS},
+}
+THUMBNAIL_FORMATS = {
+    'jpeg': ('jpg', 'image/jpeg', {'format': 'JPEG', 'quality': 80, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', 'image/webp', {'format': 'WEBP', 'quality': 75, 'method': 4}),
+}
+THUMBNAIL_VERSION = 1  # bump after a rendering change: it is part of the cache path, the URL and the ETag
+
+# Image-less PPAs all point at one shared, content-addressed file per leading letter or digit
+AVATAR_DIR = 'ppa_images/avatars'
+AVATAR_SIZE = (200, 200)
+AVATAR_BACKGROUND = (108, 117, 125)
+AVATAR_CHARACTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+AVATAR_FALLBACK = 'P'
+
+# Processing runs in the background_task worker (manage.py process_tasks), so queued jobs survive restarts
+IMAGE_QUEUE = 'images'
+
+def is_new_upload(field_file):
+    """True when the file was assigned in this request and has not been written to storage yet."""
+    return bool(field_file) and not field_file._committed
+
+
+def crop_to_ratio(img, ratio):
+    width, height = img.size
+    if width / height > ratio:
+        new_width = int(height * ratio)
+        left = (width - new_width) // 2
+        return img.crop((left, 0, left + new_width, height))
+    if width / height < ratio:
+        new_height = int(width / ratio)
+        top = (height - new_height) // 2
+        return img.crop((0, top, width, top + new_height))
+    return img
+
+
+def encode(img, **options):
+    output = BytesIO()
+    img.save(output, **options)
+    return output.getvalue()
+
+
+def open_scaled(source, min_size):
+    """
+    Open an image for processing, letting JPEGs decode straight at 1/2, 1/4 or 1/8 scale (draft
+    mode) as long as the result still covers min_size. A phone photo then never exists in memory
+    at full resolution.
+    """
+    img = Image.open(source)
+    if img.format == 'JPEG':
+        width, height = min_size
+        if img.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+            width, height = height, width  # stored sideways; the size we need is in stored orientation
+        img.draft('RGB', (width, height))
+    return ImageOps.exif_transpose(img).convert('RGB')
+
+
+def ingest_image(source, size, quality, ratio=None):
+    """Decode once (at reduced scale where possible), transpose, crop to ratio, fit within size and encode once."""
+    img = open_scaled(source, (size[0], round(size[0] / ratio)) if ratio else size)
+    if ratio:
+        img = crop_to_ratio(img, ratio)
+    img.thumbnail(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return encode(img, format='JPEG', quality=quality, optimize=True), img.size
+
+
+def fills_box(size, box):
+    """Whether an image of size, cropped to the box's aspect ratio, covers the box without upscaling."""
+    width, height = size
+    ratio = box[0] / box[1]
+    if width / height > ratio:
+        width = height * ratio
+    else:
+        height = width / ratio
+    return width + 0.5 >= box[0] and height + 0.5 >= box[1]
+
+
+def thumbnail_boxes(name):
+    for prefix, boxes in THUMBNAIL_BOXES.items():
+        if name.startswith(prefix):
+            return boxes
+    return {}
+
+
+def available_widths(name, size):
+    return [width for width, box in sorted(thumbnail_boxes(name).items()) if fills_box(size, box)]
+
+
+# model label -> (file field, status field, widths field, master size, quality, crop ratio)
+IMAGE_JOBS = {
+    'nysc.ppa': ('image', 'image_status', 'image_widths', PPA_IMAGE_SIZE, 85, PPA_IMAGE_RATIO),
+    'nysc.userprofile': ('profile_picture', 'picture_status', 'picture_widths', PROFILE_PICTURE_SIZE, 85, None),
+}
+
+
+def process_image(model, pk, original_name):
+    """
+    Replace a stored upload with its processed master JPEG and mark the row ready. The row is only
+    updated if it still points at original_name, so a newer upload that raced this job wins.
+    """
+    field_name, status_field, widths_field, size, quality, ratio = IMAGE_JOBS[model._meta.label_lower]
+    field = model._meta.get_field(field_name)
+    storage = field.storage
+    try:
+        with storage.open(original_name, 'rb') as source:
+            master, master_size = ingest_image(source, size, quality, ratio)
+        processed_name = storage.save(
+            field.generate_filename(None, f"{original_name.rsplit('/', 1)[-1].rsplit('.', 1)[0]}_compressed.jpg"),
+            ContentFile(master)
+        )
+    except Exception as e:
+        logger.error(f"Image processing failed for {model.__name__} {pk} ({original_name}): {str(e)}")
+        model.objects.filter(pk=pk, **{field_name: original_name}).update(**{status_field: IMAGE_FAILED})
+        return None
+
+    updates = {field_name: processed_name, status_field: IMAGE_READY, widths_field: available_widths(processed_name, master_size)}
+    if any(f.name == 'updated_at' for f in model._meta.concrete_fields):
+        updates['updated_at'] = timezone.now()  # moves the card fragment cache keys on
+    if model.objects.filter(pk=pk, **{field_name: original_name}).update(**updates):
+        storage.delete(original_name)
+        logger.info(f"Processed {field_name} for {model.__name__} {pk}: {processed_name}")
+        image_processed(model)
+    else:
+        storage.delete(processed_name)
+        logger.info(f"Discarded processed {field_name} for {model.__name__} {pk}; it was replaced meanwhile")
+    return processed_name
+
+
+def record_widths(instance, field_name):
+    """Fill in the responsive widths of an image processed before widths were recorded."""
+    widths_field = IMAGE_JOBS[instance._meta.label_lower][2]
+    field_file = getattr(instance, field_name)
+    with field_file.storage.open(field_file.name, 'rb') as source, Image.open(source) as img:
+        widths = available_widths(field_file.name, img.size)
+    type(instance).objects.filter(pk=instance.pk, **{field_name: field_file.name}).update(**{widths_field: widths})
+    return widths
+
+
+def image_processed(model):
+    # Cached pages, cards and featured lists hold the old file URL
+    from .featured import invalidate_featured_ppas
+    from .page_cache import bump_page_cache_tags
+    if model._meta.label_lower == 'nysc.ppa':
+        invalidate_featured_ppas()
+        bump_page_cache_tags('ppa')
+
+
+def avatar_character(name):
+    for char in (name or '').upper():
+        if char in AVATAR_CHARACTERS:
+            return char
+    return AVATAR_FALLBACK
+
+
+def render_letter_avatar(char):
+    from PIL import ImageDraw, ImageFont
+    img = Image.new('RGB', AVATAR_SIZE, color=AVATAR_BACKGROUND)
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default()
+    position = ((AVATAR_SIZE[0] - draw.textlength(char, font=font)) / 2, (AVATAR_SIZE[1] - font.size) / 2)
+    draw.text(position, char, fill=(248, 249, 250), font=font)
+    return encode(img, format='JPEG', quality=70)
+
+
+@functools.lru_cache(maxsize=None)
+def letter_avatar_file(char):
+    # The name carries a hash of the bytes, so a restyle gets new files instead of changing cached ones
+    content = render_letter_avatar(char)
+    return f"{AVATAR_DIR}/{char}-{hashlib.sha1(content).hexdigest()[:12]}.jpg", content
+
+
+def letter_avatar(char):
+    """Storage name of the shared avatar for char, written on first use."""
+    name, content = letter_avatar_file(char)
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(content))
+        logger.info(f"Wrote shared letter avatar {name}")
+    return name
+
+
+def avatar_for(name):
+    return letter_avatar(avatar_character(name))
+
+
+class TrackedImagesMixin:
+    """
+    Field-level change tracking for the models in IMAGE_JOBS. Stored file names are snapshotted on
+    load and after each save, so save() only queues processing for a genuinely new upload, leaves
+    unchanged image columns out of the UPDATE (a stale instance cannot undo a finished job), and
+    cleans up the processed file and thumbnails a replaced image leaves behind.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_images()
+        return instance
+
+    def _image_fields(self):
+        field_name, status_field, widths_field = IMAGE_JOBS[self._meta.label_lower][:3]
+        return field_name, status_field, widths_field
+
+    def _snapshot_images(self):
+        field_name = self._image_fields()[0]
+        if field_name in self.__dict__:  # not deferred
+            self._stored_image = getattr(self, field_name).name or ''
+
+    def image_changed(self):
+        stored = getattr(self, '_stored_image', None)
+        return stored is None or (getattr(self, self._image_fields()[0]).name or '') != stored
+
+    def save(self, *args, **kwargs):
+        field_name, status_field, widths_field = self._image_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and field_name not in update_fields:
+            return super().save(*args, **kwargs)
+
+        fresh = is_new_upload(getattr(self, field_name))
+        if fresh:
+            setattr(self, status_field, IMAGE_PENDING)
+            setattr(self, widths_field, [])
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {status_field, widths_field}
+        elif update_fields is None and not self._state.adding and not self.image_changed():
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in (field_name, status_field, widths_field)
+            ]
+
+        replaced = getattr(self, '_stored_image', None) if self.image_changed() else None
+        super().save(*args, **kwargs)
+        if fresh:
+            enqueue_image(self, field_name)
+        if replaced and not replaced.startswith(AVATAR_DIR):
+            storage = self._meta.get_field(field_name).storage
+            transaction.on_commit(lambda: discard_image(storage, replaced))
+        self._snapshot_images()
+
+
+def discard_image(storage, name):
+    storage.delete(name)
+    purged = purge_thumbnails(name)
+    logger.info(f"Deleted replaced image {name} and {purged} cached thumbnails")
+
+
+@background(queue=IMAGE_QUEUE)
+def process_image_task(label, pk, original_name):
+    process_image(apps.get_model(label), pk, original_name)
+
+
+def enqueue_image(instance, field_name):
+    """Queue a freshly stored upload for the image worker once the saving transaction commits."""
+    label, pk, original_name = instance._meta.label_lower, instance.pk, getattr(instance, field_name).name
+
+    def submit():
+        if getattr(settings, 'IMAGE_PROCESSING_ASYNC', True):
+            process_image_task(label, pk, original_name, verbose_name=f"Process {label} {pk} image")
+        else:
+            process_image(apps.get_model(label), pk, original_name)
+
+    transaction.on_commit(submit)
+
+
+class ThumbnailNotAllowed(ValueError):
+    pass
+
+
+def thumbnail_root():
+    return os.path.join(settings.MEDIA_ROOT, 'thumbs')
+
+
+def thumbnail_path(name, box, fmt):
+    # Older versions' files are never hit again and age out through the LRU limit
+    return os.path.join(
+        thumbnail_root(), f"v{THUMBNAIL_VERSION}", f"{box[0]}x{box[1]}", *name.split('/')
+    ) + f".{THUMBNAIL_FORMATS[fmt][0]}"
+
+
+def check_thumbnail_request(name, box):
+    parts = name.split('/')
+    if '\\' in name or any(part in ('', '.', '..') for part in parts):
+        raise ThumbnailNotAllowed(f"Bad image path {name!r}")
+    if tuple(box) not in thumbnail_boxes(name).values():
+        raise ThumbnailNotAllowed(f"{box[0]}x{box[1]} is not an allowed size for {name}")
+
+
+def thumbnail_etag(storage, name, box, fmt):
+    """Strong ETag from the source file's identity and the rendering parameters; no image is opened."""
+    modified = storage.get_modified_time(name).timestamp()
+    digest = hashlib.sha1(
+        f"{name}:{modified}:{storage.size(name)}:{box[0]}x{box[1]}:{fmt}:{THUMBNAIL_VERSION}".encode('utf-8')
+    ).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def render_thumbnail(source, box, fmt):
+    img = open_scaled(source, box)
+    img = crop_to_ratio(img, box[0] / box[1])
+    img.thumbnail(box, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return encode(img, **THUMBNAIL_FORMATS[fmt][2])
+
+
+def get_thumbnail(storage, name, box, fmt):
+    """Path of the cached thumbnail of name at box, rendering it on first request."""
+    check_thumbnail_request(name, box)
+    path = thumbnail_path(name, box, fmt)
+    try:
+        if os.path.getmtime(path) >= storage.get_modified_time(name).timestamp():
+            os.utime(path)  # mtime doubles as last-used time for LRU eviction
+            return path
+    except FileNotFoundError:
+        pass
+    with storage.open(name, 'rb') as source:
+        content = render_thumbnail(source, box, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write aside and rename, so concurrent requests never serve a half-written file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as handle:
+        handle.write(content)
+    os.replace(temp_path, path)
+    logger.debug(f"Rendered thumbnail {path} ({len(content)} bytes)")
+    _thumbnail_cache.added(len(content))
+    return path
+
+
+def purge_thumbnails(name):
+    purged = 0
+    for box in thumbnail_boxes(name).values():
+        for fmt in THUMBNAIL_FORMATS:
+            try:
+                os.remove(thumbnail_path(name, box, fmt))
+                purged += 1
+            except FileNotFoundError:
+                pass
+    return purged
+
+
+class ThumbnailCacheLimit:
+    """
+    Keeps the thumbnail directory under THUMBNAIL_CACHE_MAX_BYTES by deleting the least recently
+    used files (hits refresh mtime). The running total is per process and only approximate; every
+    eviction rescans the directory, so several web processes still converge on the cap.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = None
+
+    def scan(self):
+        files = []
+        for directory, _, names in os.walk(thumbnail_root()):
+            for filename in names:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def added(self, size):
+        limit = getattr(settings, 'THUMBNAIL_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+        with self.lock:
+            self.total = sum(size for _, size, _ in self.scan()) if self.total is None else self.total + size
+            if self.total <= limit:
+                return
+            files = sorted(self.scan())
+            self.total = sum(size for _, size, _ in files)
+            evicted = 0
+            for _, size, path in files:
+                if self.total <= limit * 0.9:  # evict a margin so the next few writes do not rescan
+                    break
+                try:
+                    os.remove(path)
+                    self.total -= size
+                    evicted += 1
+                except FileNotFoundError:
+                    pass
+            logger.info(f"Evicted {evicted} thumbnails; cache now {self.total} bytes")
+
+
+_thumbnail_cache = ThumbnailCacheLimit()
+
+
+def thumbnail_url(name, width):
+    box = thumbnail_boxes(name)[width]
+    # Responses are immutable, so a rendering change needs a new URL as well as a new file
+    return f"{reverse('thumbnail', kwargs={'width': box[0], 'height': box[1], 'name': name})}?v={THUMBNAIL_VERSION}"
@@ -0,0 +1,56 @@
+# nysc/management/commands/benchmark_geolookup.py
+from django.core.management.base import BaseCommand, CommandError
+from nysc.utils import get_state_index, get_state_from_coords
+import logging
+import random
+import time
+
+# Nigeria's bounding box, padded slightly so some points fall outside
+LAT_RANGE = (4.0, 14.0)
+LON_RANGE = (2.5, 15.0)
+
+class Command(BaseCommand):
+    help = 'Measures per-lookup latency of state reverse geocoding on random points.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=20000, help='Number of random points to look up.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for reproducible runs.')
+        parser.add_argument('--max-ms', type=float, default=1.0, help='Fail if the p99 latency exceeds this many milliseconds.')
+
+    def handle(self, *args, **options):
+        if options['points'] < 1:
+            raise CommandError('Need at least one point.')
+
+        started = time.perf_counter()
+        state_index = get_state_index()
+        if state_index is None:
+            raise CommandError('State polygons could not be loaded.')
+        self.stdout.write(f'Index load: {(time.perf_counter() - started) * 1000:.1f} ms '
+                          f'({len(state_index)} states)')
+
+        rng = random.Random(options['seed'])
+        points = [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(options['points'])]
+
+        # Per-lookup logging would dominate the timings
+        nysc_logger = logging.getLogger('nysc')
+        previous_level = nysc_logger.level
+        nysc_logger.setLevel(logging.ERROR)
+        timings = []
+        try:
+            for lat, lon in points:
+                started = time.perf_counter()
+                get_state_from_coords(lat, lon)
+                timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            nysc_logger.setLevel(previous_level)
+
+        timings.sort()
+        mean = sum(timings) / len(timings)
+        p50 = timings[len(timings) // 2]
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(
+            f'{len(timings)} lookups: mean {mean:.4f} ms, p50 {p50:.4f} ms, p99 {p99:.4f} ms, max {timings[-1]:.4f} ms'
+        )
+        if p99 > options['max_ms']:
+            raise CommandError(f"p99 latency {p99:.4f} ms exceeds {options['max_ms']} ms")
+        self.stdout.write(self.style.SUCCESS(f"p99 latency is within {options['max_ms']} ms"))
@@ -0,0 +1,49 @@
+# nysc/management/commands/build_state_geometry.py
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from nysc.utils import compile_state_geometry, save_geometry
+import shapely
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Compiles the Nigerian state polygons into the binary artifact loaded by the state lookup.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tolerance', type=float, default=getattr(settings, 'STATE_GEOMETRY_TOLERANCE', 0.0001),
+            help='Simplification tolerance in degrees (0 keeps every vertex).'
+        )
+        parser.add_argument(
+            '--output', default=getattr(settings, 'STATE_GEOMETRY_PATH', None),
+            help='Where to write the .npz file. Defaults to settings.STATE_GEOMETRY_PATH.'
+        )
+        parser.add_argument(
+            '--grid-cell-size', type=float, default=getattr(settings, 'STATE_GRID_CELL_SIZE', 0.02),
+            help='Cell size in degrees for the precomputed interior grid (0 disables it).'
+        )
+
+    def handle(self, *args, **options):
+        output = options['output']
+        tolerance = options['tolerance']
+        if not output:
+            raise CommandError('No output path given and STATE_GEOMETRY_PATH is not set.')
+        grid_cell_size = options['grid_cell_size']
+        if tolerance < 0 or grid_cell_size < 0:
+            raise CommandError('Tolerance and grid cell size must not be negative.')
+        if not output.endswith('.npz'):
+            output += '.npz'  # numpy appends it anyway
+
+        geometries, names = compile_state_geometry(tolerance)
+        if not len(geometries):
+            raise CommandError('No state polygons could be loaded from the GeoJSON source.')
+
+        save_geometry(output, geometries, names, tolerance, grid_cell_size)
+        vertices = int(shapely.get_num_coordinates(geometries).sum())
+        size_kb = os.path.getsize(output) / 1024
+        logger.info(f"Compiled {len(names)} state polygons ({vertices} vertices) to {output}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {len(names)} state polygons ({vertices} vertices, {size_kb:.0f} KB) to {output}'
+        ))
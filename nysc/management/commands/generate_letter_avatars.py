@@ -0,0 +1,95 @@
+# nysc/management/commands/generate_letter_avatars.py
+import re
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from nysc.images import AVATAR_BACKGROUND, AVATAR_CHARACTERS, AVATAR_SIZE, avatar_for, image_processed, letter_avatar
+from PIL import Image, ImageChops
+from nysc.models import PPA
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Per-PPA placeholders written by the old PPASubmissionForm.save. The old PPA.save re-encoded the image
+# into a new "<stem>_compressed.jpg" on every save, so the stored name carries one _compressed per save,
+# each (like the original) with Django's optional 7-char clash suffix.
+LEGACY_AVATAR_RE = re.compile(r'^(ppa_images/[^/]*_avatar(?:_[a-zA-Z0-9]{7})?)((?:_compressed(?:_[a-zA-Z0-9]{7})?)*)\.jpg$')
+# A clash suffix is only one if the next segment (or the end) follows; '_compres' is 7 characters too
+COMPRESSED_RE = re.compile(r'_compressed(?:_[a-zA-Z0-9]{7}(?=_compressed|$))?')
+
+
+def legacy_avatar_files(image):
+    """Every file in a legacy avatar's chain, from the form's original to the stored name; None if image is not one."""
+    match = LEGACY_AVATAR_RE.match(image)
+    if not match:
+        return None
+    stem, suffixes = match.groups()
+    segments = COMPRESSED_RE.findall(suffixes)
+    return [f"{stem}{''.join(segments[:count])}.jpg" for count in range(len(segments) + 1)]
+
+# The old placeholder was AVATAR_SIZE, flat AVATAR_BACKGROUND and a default-font letter about 11 px
+# high in the middle. Each old re-encode cropped it to 3:2 (200x133), so the height varies.
+LEGACY_AVATAR_MIN_HEIGHT = 130
+LEGACY_AVATAR_MAX_MARK = 40  # px; bounding box of everything that is not background
+LEGACY_AVATAR_TOLERANCE = 24  # per-channel difference still counted as background (JPEG noise)
+
+
+def is_legacy_placeholder(name):
+    """True only if the stored file looks like the old generated placeholder, not a real photo."""
+    try:
+        with default_storage.open(name) as f, Image.open(f) as img:
+            img = img.convert('RGB')
+    except (OSError, ValueError):
+        return False
+    width, height = img.size
+    if width > AVATAR_SIZE[0] or height > AVATAR_SIZE[1] or width < AVATAR_SIZE[0] - 5 or height < LEGACY_AVATAR_MIN_HEIGHT:
+        return False
+    diff = ImageChops.difference(img, Image.new('RGB', img.size, AVATAR_BACKGROUND))
+    mask = diff.point(lambda value: 255 if value > LEGACY_AVATAR_TOLERANCE else 0).convert('L')
+    mark = mask.getbbox()
+    if mark is None:
+        return False  # no letter at all
+    left, top, right, bottom = mark
+    centre_x, centre_y = (left + right) / 2, (top + bottom) / 2
+    return (right - left <= LEGACY_AVATAR_MAX_MARK and bottom - top <= LEGACY_AVATAR_MAX_MARK
+            and abs(centre_x - width / 2) <= LEGACY_AVATAR_MAX_MARK / 2
+            and abs(centre_y - height / 2) <= LEGACY_AVATAR_MAX_MARK / 2)
+
+class Command(BaseCommand):
+    help = 'Writes the shared letter avatars and optionally repoints PPAs at them from their old per-PPA copies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--relink', action='store_true', help='Point PPAs with a legacy per-PPA avatar at the shared one and delete the old file')
+
+    def handle(self, *args, **options):
+        for char in AVATAR_CHARACTERS:
+            letter_avatar(char)
+        self.stdout.write(self.style.SUCCESS(f'{len(AVATAR_CHARACTERS)} shared letter avatars in place'))
+
+        if not options['relink']:
+            return
+        relinked = skipped = 0
+        for ppa_id, name, image in PPA.objects.filter(image__endswith='.jpg').values_list('id', 'name', 'image').iterator(chunk_size=500):
+            files = legacy_avatar_files(image)
+            if files is None:
+                continue
+            # The name pattern alone also matches uploads such as "my_avatar.jpg"
+            if not is_legacy_placeholder(image):
+                logger.warning(f"Skipping PPA {ppa_id}: {image} is named like a legacy avatar but is not a placeholder")
+                skipped += 1
+                continue
+            if PPA.objects.filter(pk=ppa_id, image=image).update(image=avatar_for(name)):
+                # Earlier links in the chain were orphaned when each re-encode was saved
+                for file_name in files:
+                    if PPA.objects.filter(image=file_name).exists() or not default_storage.exists(file_name):
+                        continue
+                    if is_legacy_placeholder(file_name):
+                        default_storage.delete(file_name)
+                    else:
+                        logger.warning(f"Kept {file_name}: it is not a legacy placeholder")
+                relinked += 1
+        if relinked:
+            image_processed(PPA)
+        logger.info(f"Relinked {relinked} PPAs to shared letter avatars, skipped {skipped}")
+        self.stdout.write(self.style.SUCCESS(f'Relinked {relinked} PPAs to shared letter avatars'))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {skipped} images named like legacy avatars that are not placeholders'))
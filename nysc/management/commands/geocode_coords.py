@@ -0,0 +1,79 @@
+# nysc/management/commands/geocode_coords.py
+from django.core.management.base import BaseCommand, CommandError
+from nysc.utils import get_states_from_coords
+import csv
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Adds a state column to a CSV of coordinates using the batch state lookup.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='CSV file with a header row.')
+        parser.add_argument('--output', help='Where to write the result. Defaults to the command\'s stdout.')
+        parser.add_argument('--lat-column', default='lat', help='Name of the latitude column.')
+        parser.add_argument('--lon-column', default='lon', help='Name of the longitude column.')
+        parser.add_argument('--state-column', default='state', help='Name of the column to write states to.')
+        parser.add_argument('--batch-size', type=int, default=50000, help='Rows geocoded per batch.')
+
+    def handle(self, *args, **options):
+        lat_column = options['lat_column']
+        lon_column = options['lon_column']
+        state_column = options['state_column']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('Batch size must be at least 1.')
+
+        try:
+            infile = open(options['input'], newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError(f"Could not open {options['input']}: {e}")
+
+        outfile = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else self.stdout
+        total = 0
+        unmatched = 0
+        try:
+            reader = csv.DictReader(infile)
+            if not reader.fieldnames or lat_column not in reader.fieldnames or lon_column not in reader.fieldnames:
+                raise CommandError(f"Input must have '{lat_column}' and '{lon_column}' columns.")
+            fieldnames = list(reader.fieldnames)
+            if state_column not in fieldnames:
+                fieldnames.append(state_column)
+            writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+            writer.writeheader()
+
+            batch = []
+            for row in reader:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    unmatched += self.write_batch(writer, batch, lat_column, lon_column, state_column)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                unmatched += self.write_batch(writer, batch, lat_column, lon_column, state_column)
+                total += len(batch)
+        finally:
+            infile.close()
+            if outfile is not self.stdout:
+                outfile.close()
+
+        logger.info(f"Geocoded {total} rows from {options['input']}, {unmatched} without a state")
+        self.stderr.write(self.style.SUCCESS(f'Geocoded {total} rows ({unmatched} without a state).'))
+
+    def write_batch(self, writer, rows, lat_column, lon_column, state_column):
+        lats = [self.to_float(row[lat_column]) for row in rows]
+        lons = [self.to_float(row[lon_column]) for row in rows]
+        states = get_states_from_coords(lats, lons)
+        for row, state in zip(rows, states):
+            row[state_column] = state or ''
+        writer.writerows(rows)
+        return sum(1 for state in states if state is None)
+
+    @staticmethod
+    def to_float(value):
+        # Blank or malformed coordinates become NaN, which never matches a state
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return float('nan')
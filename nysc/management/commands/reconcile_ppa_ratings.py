@@ -0,0 +1,14 @@
+# nysc/management/commands/reconcile_ppa_ratings.py
+from django.core.management.base import BaseCommand
+from nysc.models import PPA
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Rebuilds the stored avg_rating and review_count of every PPA from its reviews.'
+
+    def handle(self, *args, **options):
+        updated = PPA.objects.refresh_rating_stats()
+        logger.info(f"Reconciled rating stats for {updated} PPAs")
+        self.stdout.write(self.style.SUCCESS(f'Reconciled rating stats for {updated} PPAs'))
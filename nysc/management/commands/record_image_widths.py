@@ -0,0 +1,31 @@
+# nysc/management/commands/record_image_widths.py
+from django.core.management.base import BaseCommand
+from nysc.images import image_processed, record_widths
+from nysc.models import PPA, UserProfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Records which responsive thumbnail widths each stored image can serve, for images processed before widths were tracked.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Recompute widths that are already recorded')
+
+    def handle(self, *args, **options):
+        for model, field_name, widths_field in ((PPA, 'image', 'image_widths'), (UserProfile, 'profile_picture', 'picture_widths')):
+            queryset = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            if not options['force']:
+                queryset = queryset.filter(**{widths_field: []})
+            done = failed = 0
+            for instance in queryset.only('pk', field_name).iterator(chunk_size=200):
+                try:
+                    record_widths(instance, field_name)
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"Could not read {model.__name__} {instance.pk} image: {str(e)}")
+            if done:
+                image_processed(model)
+            logger.info(f"Recorded widths for {done} {model.__name__} images ({failed} failed)")
+            self.stdout.write(self.style.SUCCESS(f'Recorded widths for {done} {model.__name__} images ({failed} failed)'))
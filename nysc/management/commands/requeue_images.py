@@ -0,0 +1,32 @@
+# nysc/management/commands/requeue_images.py
+from background_task.models import Task
+from django.core.management.base import BaseCommand
+from nysc.images import IMAGE_FAILED, IMAGE_JOBS, IMAGE_PENDING, IMAGE_QUEUE, process_image_task
+from nysc.models import PPA, UserProfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Queues processing again for images left in "processing" with no job behind them, e.g. jobs lost before they were queued durably.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--failed', action='store_true', help='Also retry images whose processing failed')
+
+    def handle(self, *args, **options):
+        statuses = [IMAGE_PENDING, IMAGE_FAILED] if options['failed'] else [IMAGE_PENDING]
+        queued = {tuple(task.params()[0]) for task in Task.objects.filter(queue=IMAGE_QUEUE)}
+        for model in (PPA, UserProfile):
+            label = model._meta.label_lower
+            field_name, status_field = IMAGE_JOBS[label][:2]
+            queryset = model.objects.filter(**{f'{status_field}__in': statuses}).exclude(**{field_name: ''})
+            requeued = 0
+            for pk, name in queryset.values_list('pk', field_name).iterator(chunk_size=200):
+                if (label, pk, name) in queued:
+                    continue
+                # process_image only updates a row that still points at this file, so a stray repeat is harmless
+                model.objects.filter(pk=pk, **{field_name: name}).update(**{status_field: IMAGE_PENDING})
+                process_image_task(label, pk, name, verbose_name=f"Process {label} {pk} image")
+                requeued += 1
+            logger.info(f"Requeued {requeued} {model.__name__} images")
+            self.stdout.write(self.style.SUCCESS(f'Requeued {requeued} {model.__name__} images'))
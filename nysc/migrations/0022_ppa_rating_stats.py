@@ -0,0 +1,39 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:50
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_stats(apps, schema_editor):
+    PPA = apps.get_model('nysc', 'PPA')
+    PPAReview = apps.get_model('nysc', 'PPAReview')
+    reviews = PPAReview.objects.filter(ppa=models.OuterRef('pk')).order_by().values('ppa')
+    PPA.objects.update(
+        review_count=Coalesce(models.Subquery(reviews.annotate(count=models.Count('pk')).values('count')), 0),
+        avg_rating=Coalesce(models.Subquery(reviews.annotate(avg=models.Avg('rating')).values('avg')), 0.0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nysc', '0021_alter_leaderboardentry_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ppa',
+            name='avg_rating',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ppa',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='ppa',
+            index=models.Index(fields=['is_approved', '-avg_rating'], name='nysc_ppa_approved_rating_idx'),
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nysc', '0022_ppa_rating_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ppa',
+            index=models.Index(fields=['is_approved', '-created_at', '-id'], name='nysc_ppa_approved_created_idx'),
+        ),
+    ]
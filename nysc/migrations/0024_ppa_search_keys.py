@@ -0,0 +1,65 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+def _normalize(value):
+    return ' '.join((value or '').split()).casefold()
+
+
+def backfill_search_keys(apps, schema_editor):
+    PPA = apps.get_model('nysc', 'PPA')
+    # Finder state/sector filters become exact matches, so fold stray casing onto the choice values
+    states = {_normalize(value): value for value, _ in PPA._meta.get_field('state').choices}
+    sectors = {_normalize(value): value for value, _ in PPA._meta.get_field('sector').choices}
+    batch = []
+    for ppa in PPA.objects.only('id', 'name', 'address', 'lga', 'state', 'sector').iterator(chunk_size=500):
+        ppa.name_key = _normalize(ppa.name)
+        ppa.address_key = _normalize(ppa.address)
+        ppa.lga_key = _normalize(ppa.lga)
+        ppa.state = states.get(_normalize(ppa.state), ppa.state)
+        ppa.sector = sectors.get(_normalize(ppa.sector), ppa.sector)
+        batch.append(ppa)
+        if len(batch) >= 500:
+            PPA.objects.bulk_update(batch, ['name_key', 'address_key', 'lga_key', 'state', 'sector'])
+            batch = []
+    if batch:
+        PPA.objects.bulk_update(batch, ['name_key', 'address_key', 'lga_key', 'state', 'sector'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nysc', '0023_ppa_created_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ppa',
+            name='address_key',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='ppa',
+            name='lga_key',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='ppa',
+            name='name_key',
+            field=models.CharField(default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(backfill_search_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ppa',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['state', 'lga_key', 'sector', 'stipend', 'accommodation_available'], name='nysc_ppa_finder_location_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ppa',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['sector', 'stipend'], name='nysc_ppa_finder_sector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ppa',
+            index=models.Index(fields=['name_key', 'address_key'], name='nysc_ppa_name_address_key_idx'),
+        ),
+    ]
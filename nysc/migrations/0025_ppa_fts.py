@@ -0,0 +1,69 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:40
+
+from django.db import migrations
+
+# External-content FTS5 index over PPA text; triggers keep it in step with every write path,
+# including queryset.update() and raw SQL, which model signals would miss.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE nysc_ppa_fts USING fts5(
+        name, description, address, lga,
+        content='nysc_ppa', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER nysc_ppa_fts_ai AFTER INSERT ON nysc_ppa BEGIN
+        INSERT INTO nysc_ppa_fts(rowid, name, description, address, lga)
+        VALUES (new.id, new.name, new.description, new.address, new.lga);
+    END
+    """,
+    """
+    CREATE TRIGGER nysc_ppa_fts_ad AFTER DELETE ON nysc_ppa BEGIN
+        INSERT INTO nysc_ppa_fts(nysc_ppa_fts, rowid, name, description, address, lga)
+        VALUES ('delete', old.id, old.name, old.description, old.address, old.lga);
+    END
+    """,
+    """
+    CREATE TRIGGER nysc_ppa_fts_au AFTER UPDATE OF name, description, address, lga ON nysc_ppa BEGIN
+        INSERT INTO nysc_ppa_fts(nysc_ppa_fts, rowid, name, description, address, lga)
+        VALUES ('delete', old.id, old.name, old.description, old.address, old.lga);
+        INSERT INTO nysc_ppa_fts(rowid, name, description, address, lga)
+        VALUES (new.id, new.name, new.description, new.address, new.lga);
+    END
+    """,
+    "INSERT INTO nysc_ppa_fts(nysc_ppa_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS nysc_ppa_fts_au",
+    "DROP TRIGGER IF EXISTS nysc_ppa_fts_ad",
+    "DROP TRIGGER IF EXISTS nysc_ppa_fts_ai",
+    "DROP TABLE IF EXISTS nysc_ppa_fts",
+]
+
+
+def create_fts(apps, schema_editor):
+    # Other backends fall back to icontains in nysc.search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nysc', '0024_ppa_search_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nysc', '0025_ppa_fts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ppareview',
+            index=models.Index(fields=['ppa', '-created_at', '-id'], name='nysc_review_ppa_created_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nysc', '0026_ppareview_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ppa',
+            name='image_status',
+            field=models.CharField(choices=[('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='picture_status',
+            field=models.CharField(choices=[('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', editable=False, max_length=20),
+        ),
+    ]
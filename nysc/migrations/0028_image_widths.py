@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nysc', '0027_image_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ppa',
+            name='image_widths',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='picture_widths',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nysc', '0028_image_widths'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ppa',
+            name='verification_ocr_status',
+            field=models.CharField(blank=True, choices=[('', 'Not run'), ('queued', 'Queued'), ('done', 'Done'), ('failed', 'Failed')], default='', editable=False, help_text="Automatic check of the verification document; 'queued' until the worker has read it", max_length=20),
+        ),
+    ]
@@ -3,18 +3,16 @@ from django.db import transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 import uuid
-from PIL import Image, ImageOps
-from io import BytesIO
-from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.core.validators import URLValidator
-import sys
+from django.db.models.functions import Coalesce
 import logging
-import pytesseract
 import datetime
+from .utils import normalize_text
+from .images import IMAGE_READY, IMAGE_STATUS_CHOICES, TrackedImagesMixin, is_new_upload
 
 logger = logging.getLogger('nysc')  
 
-class UserProfile(models.Model):
+class UserProfile(TrackedImagesMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     profile_picture = models.ImageField(upload_to='profile_pics/', null=True, blank=True)
     bio = models.TextField(max_length=500, blank=True)
@@ -28,6 +26,8 @@ class UserProfile(models.Model):
     notify_rating = models.BooleanField(default=False, help_text="Receive notifications when a post is rated.")
     notify_leaderboard = models.BooleanField(default=False, help_text="Receive notifications when you appear on the leaderboard.")
     notify_post = models.BooleanField(default=False, help_text="Receive notifications when someone I follow posts.")
+    picture_status = models.CharField(max_length=20, choices=IMAGE_STATUS_CHOICES, default=IMAGE_READY, editable=False)
+    picture_widths = models.JSONField(default=list, blank=True, editable=False)  # responsive variants on disk
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
@@ -37,29 +37,6 @@ class UserProfile(models.Model):
             return False
         return (timezone.now() - self.last_seen).total_seconds() < timeout
 
-    def save(self, *args, **kwargs):
-        if self.profile_picture:
-            try:
-                img = Image.open(self.profile_picture)
-                img = ImageOps.exif_transpose(img)
-                img = img.convert('RGB')
-                max_size = (600, 600)
-                img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                output = BytesIO()
-                img.save(output, format='JPEG', quality=80, optimize=True)
-                output.seek(0)
-                self.profile_picture = InMemoryUploadedFile(
-                    output,
-                    'ImageField',
-                    f"{self.profile_picture.name.rsplit('.', 1)[0]}_compressed.jpg",
-                    'image/jpeg',
-                    sys.getsizeof(output),
-                    None
-                )
-            except Exception as e:
-                logger.error(f"Profile picture processing error: {e}")
-        super().save(*args, **kwargs)
-
 
 class LeaderboardReset(models.Model):
     last_reset = models.DateTimeField(null=True, blank=True, default=None)
@@ -67,6 +44,13 @@ class LeaderboardReset(models.Model):
     def __str__(self):
         return f"Last Reset: {self.last_reset}"
 
+class CatalogVersion(models.Model):
+    # Single row (id=1) bumped on every PPA catalogue change; see utils.bump_catalog_version
+    version = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return f"Catalog version {self.version}"
+
 class LeaderboardEntryManager(models.Manager):
     def reset_leaderboard(self):
         entries = self.all()
@@ -130,7 +114,17 @@ class EmailVerificationToken(models.Model):
     def __str__(self):
         return f"Token for {self.user.email}"
 
-class PPA(models.Model):
+class PPAManager(models.Manager):
+    def refresh_rating_stats(self, ppa_ids=None):
+        """Recompute avg_rating/review_count from the reviews table in one UPDATE."""
+        reviews = PPAReview.objects.filter(ppa=models.OuterRef('pk')).order_by().values('ppa')
+        queryset = self.all() if ppa_ids is None else self.filter(pk__in=ppa_ids)
+        return queryset.update(
+            review_count=Coalesce(models.Subquery(reviews.annotate(count=models.Count('pk')).values('count')), 0),
+            avg_rating=Coalesce(models.Subquery(reviews.annotate(avg=models.Avg('rating')).values('avg')), 0.0),
+        )
+
+class PPA(TrackedImagesMixin, models.Model):
     name = models.CharField(max_length=200)
     state = models.CharField(max_length=50, choices=[
         ('Abia', 'Abia'), ('Abuja', 'Abuja'), ('Adamawa', 'Adamawa'),
@@ -173,6 +167,8 @@ class PPA(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     image = models.ImageField(upload_to='ppa_images/')
+    image_status = models.CharField(max_length=20, choices=IMAGE_STATUS_CHOICES, default=IMAGE_READY, editable=False)
+    image_widths = models.JSONField(default=list, blank=True, editable=False)  # responsive variants on disk
     address = models.CharField(max_length=255)
     verified = models.BooleanField(default=False, help_text="Set to True after admin verification")
     verification_document = models.ImageField(upload_to='ppa_verifications/', null=True, blank=True, help_text="Upload PPA posting letter or clearance letter or clear photo of PPA for verification")
@@ -187,6 +183,28 @@ class PPA(models.Model):
         default='not_submitted',
         help_text="Status of verification request"
     )
+    verification_ocr_status = models.CharField(
+        max_length=20,
+        choices=[
+            ('', 'Not run'),
+            ('queued', 'Queued'),
+            ('done', 'Done'),
+            ('failed', 'Failed'),
+        ],
+        default='',
+        blank=True,
+        editable=False,
+        help_text="Automatic check of the verification document; 'queued' until the worker has read it"
+    )
+    # Denormalized from PPAReview; kept current by signals (see refresh_rating_stats)
+    avg_rating = models.FloatField(default=0, editable=False)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    # normalize_text() shadows so equality filters can use plain indexes instead of iexact
+    name_key = models.CharField(max_length=200, editable=False, default='')
+    address_key = models.CharField(max_length=255, editable=False, default='')
+    lga_key = models.CharField(max_length=100, editable=False, default='')
+
+    objects = PPAManager()
 
     class Meta:
         # Ensure no duplicate PPAs with the same name and address across all users
@@ -196,71 +214,54 @@ class PPA(models.Model):
                 name='unique_ppa_name_address'
             )
         ]
+        indexes = [
+            models.Index(fields=['is_approved', '-avg_rating'], name='nysc_ppa_approved_rating_idx'),
+            # Keyset pagination in the finder walks (created_at, id) descending
+            models.Index(fields=['is_approved', '-created_at', '-id'], name='nysc_ppa_approved_created_idx'),
+            # Finder filters narrow state -> lga -> sector, then stipend/accommodation. Partial on
+            # is_approved because SQLite renders filter(is_approved=True) as a bare column test,
+            # which cannot seek a leading boolean index column.
+            models.Index(
+                fields=['state', 'lga_key', 'sector', 'stipend', 'accommodation_available'],
+                name='nysc_ppa_finder_location_idx',
+                condition=models.Q(is_approved=True)
+            ),
+            models.Index(
+                fields=['sector', 'stipend'],
+                name='nysc_ppa_finder_sector_idx',
+                condition=models.Q(is_approved=True)
+            ),
+            models.Index(fields=['name_key', 'address_key'], name='nysc_ppa_name_address_key_idx'),
+        ]
+
+    SEARCH_KEY_SOURCES = {'name_key': 'name', 'address_key': 'address', 'lga_key': 'lga'}
+
+    def sync_search_keys(self, update_fields=None):
+        for key_field, source_field in self.SEARCH_KEY_SOURCES.items():
+            setattr(self, key_field, normalize_text(getattr(self, source_field)))
+        if update_fields is None:
+            return None
+        update_fields = set(update_fields)
+        update_fields |= {key for key, source in self.SEARCH_KEY_SOURCES.items() if source in update_fields}
+        return update_fields
 
     def save(self, *args, **kwargs):
+        kwargs['update_fields'] = self.sync_search_keys(kwargs.get('update_fields'))
+        document_queued = is_new_upload(self.verification_document) and self.verification_status != 'approved' and \
+            (kwargs['update_fields'] is None or 'verification_document' in kwargs['update_fields'])
+        if document_queued:
+            # OCR runs on the verification queue (tasks.verify_ppa_document_task); the request only stores the file
+            self.verified = False
+            self.verification_status = 'pending'
+            self.verification_ocr_status = 'queued'
+            if kwargs['update_fields'] is not None:
+                kwargs['update_fields'] |= {'verified', 'verification_status', 'verification_ocr_status'}
         with transaction.atomic():
-            if self.image:
-                try:
-                    img = Image.open(self.image)
-                    img = ImageOps.exif_transpose(img)
-                    img = img.convert('RGB')
-                    target_ratio = 3 / 2
-                    width, height = img.size
-                    current_ratio = width / height
-                    if current_ratio > target_ratio:
-                        new_width = int(height * target_ratio)
-                        left = (width - new_width) // 2
-                        img = img.crop((left, 0, left + new_width, height))
-                    elif current_ratio < target_ratio:
-                        new_height = int(width / target_ratio)
-                        top = (height - new_height) // 2
-                        img = img.crop((0, top, width, top + new_height))
-                    max_size = (300, 300)
-                    img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                    output = BytesIO()
-                    img.save(output, format='JPEG', quality=85, optimize=True)
-                    output.seek(0)
-                    self.image = InMemoryUploadedFile(
-                        output,
-                        'ImageField',
-                        f"{self.image.name.rsplit('.', 1)[0]}_compressed.jpg",
-                        'image/jpeg',
-                        sys.getsizeof(output),
-                        None
-                    )
-                except Exception as e:
-                    print(f"PPA image processing error: {e}")
-
-            # Only process verification if a new document is uploaded and status allows
-            if (self.verification_document and self.verification_status == 'not_submitted') or \
-               (self.verification_document and self.verification_status == 'rejected'):
-                try:
-                    doc_img = Image.open(self.verification_document)
-                    doc_img = doc_img.convert('L')  # Convert to grayscale
-                    pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'  # Adjust path
-                    extracted_text = pytesseract.image_to_string(doc_img).lower()
-
-                    ppa_name = self.name.lower()
-                    ppa_state = self.state.lower()
-                    ppa_lga = self.lga.lower()
-                    ppa_address = self.address.lower()
-
-                    # More strict validation
-                    if (ppa_name in extracted_text and ppa_state in extracted_text) or \
-                       (ppa_lga in extracted_text and ppa_address in extracted_text):
-                        self.verified = True
-                        self.verification_status = 'approved'
-                        print(f"OCR successfully verified PPA {self.name}")
-                    else:
-                        self.verified = False
-                        self.verification_status = 'pending'  # Trigger manual review
-                        print(f"OCR could not fully verify PPA {self.name}, pending manual review")
-                except Exception as e:
-                    print(f"OCR processing error for PPA {self.name}: {e}")
-                    self.verified = False
-                    self.verification_status = 'pending'
-
+            # TrackedImagesMixin stores a new upload as-is and queues it for the image worker pool
             super().save(*args, **kwargs)
+            if document_queued:
+                from .tasks import enqueue_verification
+                enqueue_verification(self)
 
             # Update leaderboard only if not within 24 hours of last reset
             last_reset = LeaderboardReset.objects.filter(id=1).values_list('last_reset', flat=True).first()
@@ -274,9 +275,13 @@ class PPA(models.Model):
             else:
                 logger.debug(f"Skipped leaderboard update for {self.posted_by.username} due to recent reset at {last_reset}")
 
+    @property
+    def verification_processing(self):
+        # An admin decision while the document is queued wins; the worker then discards its result
+        return self.verification_ocr_status == 'queued' and self.verification_status == 'pending'
+
     def average_rating(self):
-        reviews = self.reviews.all()
-        return sum(review.rating for review in reviews) / reviews.count() if reviews else 0
+        return self.avg_rating
 
     def __str__(self):
         return f"{self.name} - {self.state}"
@@ -288,6 +293,12 @@ class PPAReview(models.Model):
     comment = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a PPA's reviews on the detail page
+            models.Index(fields=['ppa', '-created_at', '-id'], name='nysc_review_ppa_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.ppa.name} ({self.rating} stars)"
     
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import time
+import zlib
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rendered into cached pages in place of the CSRF token and swapped for a fresh token on every serve
+CSRF_SENTINEL = 'pagecachecsrfsentinel0a9f3c7e'
+
+
+def _tag_key(tag):
+    return f"page_cache_tag:{tag}"
+
+
+def page_cache_tag_versions(tags):
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = cache.get_many(keys)
+    return {tag: found.get(key, 0) for key, tag in keys.items()}
+
+
+def bump_page_cache_tags(*tags):
+    """Mark every cached page carrying any of these tags as stale."""
+    for tag in tags:
+        key = _tag_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+class AnonymousPageCacheMixin:
+    """
+    Caches whole GET responses for logged-out visitors, zlib-compressed, keyed by path, query
+    string and the session's detected location. Entries carry the versions of page_cache_tags
+    they were built against; once a tag moves on, one request rebuilds while others keep getting
+    the stale copy until it lands.
+    """
+    page_cache_tags = ()
+    page_cache_session_keys = ()
+
+    def page_cache_applies(self, request):
+        if request.method != 'GET' or request.user.is_authenticated:
+            return False
+        # Flash messages are per visitor and must not be baked into a shared page
+        return not len(messages.get_messages(request))
+
+    def page_cache_key(self, request):
+        signature = {
+            'path': request.path,
+            'query': sorted((key, value) for key, values in request.GET.lists() for value in values if value != ''),
+            'session': [request.session.get(key) for key in self.page_cache_session_keys],
+            'ajax': request.headers.get('X-Requested-With') == 'XMLHttpRequest',
+        }
+        digest = hashlib.md5(json.dumps(signature, sort_keys=True).encode('utf-8')).hexdigest()
+        return f"page_cache:{digest}"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if getattr(self, 'page_cache_active', False):
+            context['csrf_token'] = CSRF_SENTINEL
+        return context
+
+    def serve_cached_page(self, request, entry, state):
+        content = zlib.decompress(entry['content'])
+        response = HttpResponse(content, content_type=entry['content_type'], status=entry['status'])
+        return self.finalize_cached_page(request, response, state)
+
+    def finalize_cached_page(self, request, response, state):
+        if CSRF_SENTINEL.encode() in response.content:
+            response.content = response.content.replace(CSRF_SENTINEL.encode(), get_token(request).encode())
+        response['X-Page-Cache'] = state
+        return response
+
+    def get(self, request, *args, **kwargs):
+        self.page_cache_active = self.page_cache_applies(request)
+        if not self.page_cache_active:
+            return super().get(request, *args, **kwargs)
+
+        key = self.page_cache_key(request)
+        versions = page_cache_tag_versions(self.page_cache_tags)
+        entry = cache.get(key)
+        max_age = getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+        if entry and entry['tags'] == versions and time.time() - entry['created'] < max_age:
+            return self.serve_cached_page(request, entry, 'hit')
+
+        lock_key = f"{key}:lock"
+        locked = cache.add(lock_key, 1, timeout=getattr(settings, 'PAGE_CACHE_LOCK_TIMEOUT', 30))
+        if entry and not locked:
+            return self.serve_cached_page(request, entry, 'stale')
+        try:
+            response = super().get(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            if response.status_code == 200 and not response.streaming:
+                cache.set(key, {
+                    'content': zlib.compress(response.content, 6),
+                    'content_type': response['Content-Type'],
+                    'status': response.status_code,
+                    'tags': versions,
+                    'created': time.time(),
+                }, timeout=max_age * 4)  # kept past max_age so there is a stale copy to serve
+                logger.debug(f"Stored anonymous page cache entry {key} for {request.get_full_path()}")
+        finally:
+            if locked:
+                cache.delete(lock_key)
+        return self.finalize_cached_page(request, response, 'miss')
@@ -0,0 +1,125 @@
+import base64
+import datetime
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from .utils import catalog_version
+
+DEFAULT_ORDERING = ('-created_at', '-id')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _json_default(value):
+    # Full precision: DjangoJSONEncoder truncates datetimes to milliseconds, which breaks keyset equality
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(values):
+    data = json.dumps(values, default=_json_default, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_token(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor(f"Malformed cursor: {str(e)}")
+
+
+def decode_cursor(token, fields):
+    values = _decode_token(token)
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise InvalidCursor("Cursor does not match ordering")
+    try:
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except Exception as e:
+        raise InvalidCursor(f"Bad cursor value: {str(e)}")
+
+
+def cursor_paginate(queryset, cursor, per_page, ordering=DEFAULT_ORDERING):
+    """
+    Keyset pagination over a strictly descending ordering whose last field is unique.
+    Returns (objects, next_cursor); next_cursor is None on the last page. No COUNT is run.
+    """
+    names = [name.lstrip('-') for name in ordering]
+    fields = [queryset.model._meta.get_field(name) for name in names]
+    queryset = queryset.order_by(*ordering)
+
+    if cursor:
+        values = decode_cursor(cursor, fields)
+        # (a, b, c) < (x, y, z)  ==  a < x OR (a = x AND b < y) OR (a = x AND b = y AND c < z)
+        condition = Q()
+        for i, name in enumerate(names):
+            term = Q(**{f'{name}__lt': values[i]})
+            for prior, value in zip(names[:i], values[:i]):
+                term &= Q(**{prior: value})
+            condition |= term
+        queryset = queryset.filter(condition)
+
+    objects = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(objects) > per_page:
+        objects = objects[:per_page]
+        next_cursor = cursor_for(objects[-1], ordering)
+    return objects, next_cursor
+
+
+def cursor_for(obj, ordering=DEFAULT_ORDERING):
+    # Accepts model instances or .values() rows
+    get = obj.get if isinstance(obj, dict) else lambda name: getattr(obj, name)
+    return encode_cursor([get(name.lstrip('-')) for name in ordering])
+
+
+def offset_paginate(queryset, cursor, per_page):
+    """
+    Opaque-cursor pagination by position, for orderings with no usable keyset such as search
+    relevance. Same (objects, next_cursor) contract as cursor_paginate.
+    """
+    offset = 0
+    if cursor:
+        value = _decode_token(cursor)
+        if not isinstance(value, dict) or not isinstance(value.get('offset'), int) or value['offset'] < 0:
+            raise InvalidCursor("Cursor does not hold an offset")
+        offset = value['offset']
+    objects = list(queryset[offset:offset + per_page + 1])
+    next_cursor = None
+    if len(objects) > per_page:
+        objects = objects[:per_page]
+        next_cursor = encode_cursor({'offset': offset + per_page})
+    return objects, next_cursor
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator whose COUNT(*) is cached per filter signature. Keys embed the catalog version, so any
+    PPA save, delete or bulk approval starts a fresh generation instead of serving stale totals.
+    """
+
+    def __init__(self, *args, signature=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.signature = signature
+
+    def count_cache_key(self):
+        digest = hashlib.md5(json.dumps(self.signature, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return f"ppa_count:{catalog_version()}:{digest}"
+
+    @cached_property
+    def count(self):
+        if self.signature is None:
+            return super().count
+        key = self.count_cache_key()
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, timeout=getattr(settings, 'PPA_COUNT_CACHE_TIMEOUT', 300))
+        return count
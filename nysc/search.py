@@ -0,0 +1,114 @@
+import re
+from django.db import connections
+from django.db.models import F, FloatField, Func, Q
+from django.db.models.expressions import RawSQL
+import logging
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'nysc_ppa_fts'
+# bm25() column weights, in the FTS table's column order: name, description, address, lga
+FTS_WEIGHTS = (10.0, 1.0, 3.0, 4.0)
+MAX_QUERY_TERMS = 8
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+# Mirrors migration 0025. SQLite table rebuilds (most ALTERs on nysc_ppa) drop these triggers,
+# so ensure_fts_triggers() puts them back after every migrate.
+FTS_TRIGGERS = {
+    'nysc_ppa_fts_ai': """
+        CREATE TRIGGER nysc_ppa_fts_ai AFTER INSERT ON nysc_ppa BEGIN
+            INSERT INTO nysc_ppa_fts(rowid, name, description, address, lga)
+            VALUES (new.id, new.name, new.description, new.address, new.lga);
+        END
+    """,
+    'nysc_ppa_fts_ad': """
+        CREATE TRIGGER nysc_ppa_fts_ad AFTER DELETE ON nysc_ppa BEGIN
+            INSERT INTO nysc_ppa_fts(nysc_ppa_fts, rowid, name, description, address, lga)
+            VALUES ('delete', old.id, old.name, old.description, old.address, old.lga);
+        END
+    """,
+    'nysc_ppa_fts_au': """
+        CREATE TRIGGER nysc_ppa_fts_au AFTER UPDATE OF name, description, address, lga ON nysc_ppa BEGIN
+            INSERT INTO nysc_ppa_fts(nysc_ppa_fts, rowid, name, description, address, lga)
+            VALUES ('delete', old.id, old.name, old.description, old.address, old.lga);
+            INSERT INTO nysc_ppa_fts(rowid, name, description, address, lga)
+            VALUES (new.id, new.name, new.description, new.address, new.lga);
+        END
+    """,
+}
+
+
+def ensure_fts_triggers(using='default'):
+    """Recreate any missing FTS triggers and rebuild the index if rows may have been missed."""
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE (type = 'table' AND name = %s) OR (type = 'trigger' AND tbl_name = 'nysc_ppa')",
+            [FTS_TABLE]
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if FTS_TABLE not in existing:
+            return False
+        missing = [name for name in FTS_TRIGGERS if name not in existing]
+        if not missing:
+            return False
+        for name in missing:
+            cursor.execute(FTS_TRIGGERS[name])
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    logger.info(f"Recreated FTS triggers {missing} and rebuilt {FTS_TABLE}")
+    return True
+
+
+def query_terms(q):
+    return _TERM_RE.findall(q or '')[:MAX_QUERY_TERMS]
+
+
+def build_match_expression(q):
+    """
+    Turn free text into an FTS5 MATCH expression: every word becomes a quoted prefix term and all
+    terms must match. Quoting keeps user input from being parsed as FTS5 operators or column filters.
+    """
+    return ' '.join(f'"{term}"*' for term in query_terms(q))
+
+
+class SearchRank(Func):
+    """bm25() score of a PPA's FTS row for a MATCH expression; lower is a better match."""
+    template = (
+        f'(SELECT bm25({FTS_TABLE}, %(weights)s) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %(match)s AND {FTS_TABLE}.rowid = %(expressions)s)'
+    )
+    output_field = FloatField()
+
+    def __init__(self, expression, match, **extra):
+        super().__init__(expression, weights=', '.join(str(weight) for weight in FTS_WEIGHTS), **extra)
+        self.match = match
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = super().as_sql(compiler, connection, match='%s', **extra_context)
+        # The MATCH placeholder comes before the id column in the template
+        return sql, (self.match, *params)
+
+
+def search_ppas(queryset, q):
+    """Restrict a PPA queryset to rows matching q, best matches first."""
+    terms = query_terms(q)
+    if not terms:
+        return queryset
+    if connections[queryset.db].vendor != 'sqlite':
+        # Other backends have no FTS table; degrade to substring matching on the same columns
+        for term in terms:
+            queryset = queryset.filter(
+                Q(name__icontains=term) | Q(description__icontains=term) |
+                Q(address__icontains=term) | Q(lga__icontains=term)
+            )
+        return queryset
+    match = build_match_expression(q)
+    logger.debug(f"FTS search for {terms}")
+    # Both halves are plain expressions, so the result can still be filtered, sliced or used as a subquery
+    return queryset.filter(
+        id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+    ).annotate(search_rank=SearchRank(F('id'), match)).order_by('search_rank', '-id')
@@ -1,8 +1,13 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, post_migrate
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.urls import reverse
 from .models import Follow, PPA, PPAReview, LeaderboardEntry, Notification
+from .featured import invalidate_featured_ppas
+from .search import ensure_fts_triggers
+from .utils import record_ppa_change
+from .page_cache import bump_page_cache_tags
+from django.db import transaction
 from .tasks import notify_follow_task, notify_rating_task, notify_leaderboard_task, notify_followed_post_task
 import logging
 from django.utils import timezone
@@ -61,6 +66,31 @@ def rating_notification(sender, instance, created, **kwargs):
             notify_rating_task(instance.user.id, instance.ppa.posted_by.id, instance.rating)
 
 
+@receiver(post_save, sender=PPAReview)
+@receiver(post_delete, sender=PPAReview)
+def update_ppa_rating_stats(sender, instance, **kwargs):
+    PPA.objects.refresh_rating_stats([instance.ppa_id])
+    # After commit, or a concurrent request could re-cache the pre-commit list
+    transaction.on_commit(invalidate_featured_ppas)
+    transaction.on_commit(lambda: bump_page_cache_tags('review'))
+
+
+@receiver(post_save, sender=PPA)
+@receiver(post_delete, sender=PPA)
+def ppa_featured_invalidation(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_featured_ppas)
+
+
+@receiver(post_save, sender=PPA)
+@receiver(post_delete, sender=PPA)
+def ppa_catalog_update(sender, instance, signal, **kwargs):
+    # delete() clears instance.pk before commit, so capture the id now
+    ppa_id = instance.pk
+    ppa = None if signal is post_delete else instance
+    transaction.on_commit(lambda: record_ppa_change(ppa_id, ppa))
+    transaction.on_commit(lambda: bump_page_cache_tags('ppa'))
+
+
 @receiver(post_save, sender=LeaderboardEntry)
 def leaderboard_notification(sender, instance, created, **kwargs):
     if not created:  # Only trigger on update, not creation
@@ -120,3 +150,7 @@ def post_notification(sender, instance, created, **kwargs):
                     notification.save()
 
 
+@receiver(post_migrate)
+def restore_ppa_fts_triggers(sender, using, **kwargs):
+    if sender.name == 'nysc':
+        ensure_fts_triggers(using)
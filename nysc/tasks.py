@@ -1,8 +1,13 @@
 from django.contrib.auth.models import User
-from .models import Notification, LeaderboardEntry
+from .models import Notification, LeaderboardEntry, PPA
 from django.urls import reverse
 import logging
 from django.utils import timezone
+from django.conf import settings
+from django.db import transaction
+from background_task import background
+from PIL import Image
+import pytesseract
 
 logger = logging.getLogger(__name__)
 
@@ -72,3 +77,68 @@ def notify_followed_post_task(follower_id, posted_by_id, post_id):
     except Exception as e:
         logger.error(f"Error creating post notification for {follower_id}: {str(e)}", exc_info=True)
 
+VERIFICATION_QUEUE = 'verification'
+
+def document_matches_ppa(ppa, extracted_text):
+    return (ppa.name.lower() in extracted_text and ppa.state.lower() in extracted_text) or \
+           (ppa.lga.lower() in extracted_text and ppa.address.lower() in extracted_text)
+
+def read_verification_document(field_file):
+    tesseract_cmd = getattr(settings, 'TESSERACT_CMD', None)
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    with field_file.open('rb') as f:
+        doc_img = Image.open(f).convert('L')  # Convert to grayscale
+    return pytesseract.image_to_string(doc_img).lower()
+
+@background(queue=VERIFICATION_QUEUE)
+def verify_ppa_document_task(ppa_id, document_name):
+    """
+    OCR a queued verification document and approve the PPA when the text names it. Anything the
+    check cannot confirm stays 'pending' for manual review, as before.
+    """
+    ppa = PPA.objects.filter(id=ppa_id, verification_document=document_name, verification_ocr_status='queued').first()
+    if ppa is None:
+        logger.info(f"Skipping OCR for PPA {ppa_id}: {document_name} was replaced or already reviewed")
+        return
+    try:
+        extracted_text = read_verification_document(ppa.verification_document)
+    except Exception as e:
+        logger.error(f"OCR processing error for PPA {ppa_id}: {str(e)}", exc_info=True)
+        ocr_status, approved = 'failed', False
+    else:
+        ocr_status, approved = 'done', document_matches_ppa(ppa, extracted_text)
+
+    with transaction.atomic():
+        # OCR ran outside the transaction; the owner or an admin may have moved on since
+        ppa = PPA.objects.select_for_update().filter(
+            id=ppa_id, verification_document=document_name, verification_status='pending', verification_ocr_status='queued'
+        ).first()
+        if ppa is None:
+            logger.info(f"Discarding OCR result for PPA {ppa_id}: verification changed while {document_name} was read")
+            return
+        ppa.verification_ocr_status = ocr_status
+        if approved:
+            ppa.verified = True
+            ppa.verification_status = 'approved'
+            # Approved documents are not kept
+            ppa.verification_document = None
+            storage = PPA._meta.get_field('verification_document').storage
+            transaction.on_commit(lambda: storage.delete(document_name))
+        ppa.save(update_fields=['verified', 'verification_status', 'verification_ocr_status', 'verification_document', 'updated_at'])
+    if approved:
+        logger.info(f"OCR successfully verified PPA {ppa.name}")
+    else:
+        logger.info(f"OCR could not fully verify PPA {ppa.name}, pending manual review")
+
+def enqueue_verification(ppa):
+    """Queue OCR for the PPA's freshly stored verification document once the saving transaction commits."""
+    ppa_id, document_name = ppa.pk, ppa.verification_document.name
+
+    def submit():
+        if getattr(settings, 'VERIFICATION_OCR_ASYNC', True):
+            verify_ppa_document_task(ppa_id, document_name, verbose_name=f"Verify PPA {ppa_id}")
+        else:
+            verify_ppa_document_task.now(ppa_id, document_name)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,35 @@
+# nysc/templatetags/image_tags.py
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+from ..images import thumbnail_boxes, thumbnail_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(field_file, widths, sizes='100vw', fallback='', **attrs):
+    """
+    <img> whose srcset lists the image's thumbnail widths, so the browser fetches the smallest
+    file that fills the slot described by sizes (in WebP where it accepts it). Without widths
+    (not processed yet, or never backfilled) it degrades to a plain <img> of the stored file.
+    Usage: {% responsive_image ppa.image ppa.image_widths sizes="(max-width: 576px) 100vw, 300px" alt=ppa.name class="card-img-top" %}
+    """
+    if not field_file:
+        return format_html('<img src="{}"{}>', fallback, flatatt(attrs))
+    if not widths:
+        return format_html('<img src="{}"{}>', field_file.url, flatatt(attrs))
+    srcset = ', '.join(f"{thumbnail_url(field_file.name, width)} {width}w" for width in widths)
+    return format_html(
+        '<img src="{}" srcset="{}" sizes="{}"{}>', thumbnail_url(field_file.name, widths[0]), srcset, sizes, flatatt(attrs)
+    )
+
+
+@register.filter
+def thumbnail(field_file, width):
+    """URL of a fixed-width thumbnail, e.g. {{ user.profile.profile_picture|thumbnail:64 }}; the stored file if that width is not offered."""
+    if not field_file:
+        return ''
+    if int(width) not in thumbnail_boxes(field_file.name):
+        return field_file.url
+    return thumbnail_url(field_file.name, int(width))
@@ -2,15 +2,60 @@ from django.test import TestCase
 
 # Create your tests here.
 import unittest
+import re
+from unittest import mock
 import datetime
 from django.utils import timezone
-from django.test import RequestFactory, TestCase
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
+import io
+import shutil
+import tempfile
+from PIL import Image
 from django.contrib.auth.models import User
-from .models import LeaderboardEntry, LeaderboardReset
+from .featured import get_featured_ppas, invalidate_featured_ppas
+from .page_cache import CSRF_SENTINEL
+from .views import PPAListView
+from django.core.cache import cache, caches
+from .facets import FacetIndex, get_facet_index
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from .images import (
+    AVATAR_DIR, IMAGE_PENDING, IMAGE_QUEUE, IMAGE_READY, _thumbnail_cache, get_thumbnail, ingest_image, open_scaled,
+    process_image_task, render_letter_avatar, render_thumbnail, thumbnail_path, thumbnail_url,
+)
+import os
+from django.template import Context, Template
+from django.template.loader import render_to_string
+from .models import LeaderboardEntry, LeaderboardReset, PPA, PPAReview, UserBookmark, UserProfile
+from .search import search_ppas
 from .middleware import LeaderboardMiddleware
+from .tasks import VERIFICATION_QUEUE, verify_ppa_document_task
+from background_task.models import Task
+from .utils import get_state_from_coords, get_states_from_coords, get_state_index, bump_catalog_version, reset_catalog_indexes
 
-class ResetSimulationTest(TestCase):
+# Tests never touch the on-disk cache at BASE_DIR/cache that a local dev server reads
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'nysc-tests'},
+    'fragments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'nysc-tests-fragments'},
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class NyscTestCase(TestCase):
     def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        # The catalog version restarts with each test's rollback, so indexes built by earlier tests would look current
+        reset_catalog_indexes()
+
+
+class ResetSimulationTest(NyscTestCase):
+    def setUp(self):
+        super().setUp()
         self.factory = RequestFactory()
         self.user = User.objects.create_user(username='testuser', password='testpass')
         self.entry = LeaderboardEntry.objects.create(user=self.user, points=100, total_ppas=5, verified_ppas=2)
@@ -40,6 +85,750 @@ class ResetSimulationTest(TestCase):
         self.entry.delete()
         self.reset.delete()
 
+class StateLookupTest(NyscTestCase):
+    def test_known_cities(self):
+        self.assertEqual(get_state_from_coords(6.5244, 3.3792), 'Lagos')
+        self.assertEqual(get_state_from_coords(12.0, 8.52), 'Kano')
+
+    def test_point_outside_nigeria(self):
+        self.assertIsNone(get_state_from_coords(0.0, 0.0))
+
+    def test_index_is_built_once(self):
+        self.assertIs(get_state_index(), get_state_index())
+
+    def test_batch_matches_single_lookups(self):
+        lats = [6.5244, 12.0, 0.0, 9.0765]
+        lons = [3.3792, 8.52, 0.0, 7.3986]
+        expected = [get_state_from_coords(lat, lon) for lat, lon in zip(lats, lons)]
+        self.assertEqual(get_states_from_coords(lats, lons), expected)
+
+    def test_batch_endpoint(self):
+        user = User.objects.create_user(username='geocoder', password='testpass')
+        self.client.force_login(user)
+        response = self.client.post('/states_from_coords/', {'lat': [6.5244, 0.0], 'lon': [3.3792, 0.0]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['states'], ['Lagos', None])
+
+    def test_geocode_command_writes_to_command_stdout(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as source:
+            source.write('id,lat,lon\n1,6.5244,3.3792\n2,,\n')
+        self.addCleanup(os.remove, source.name)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('geocode_coords', source.name, '--batch-size', '1', stdout=out, stderr=err)
+        self.assertEqual(out.getvalue().splitlines(), ['id,lat,lon,state', '1,6.5244,3.3792,Lagos', '2,,,'])
+        self.assertIn('Geocoded 2 rows (1 without a state)', err.getvalue())
+
+class SetUserStateTest(NyscTestCase):
+    def test_stores_state_in_session(self):
+        response = self.client.post('/set_user_state/', {'lat': 6.5244, 'lon': 3.3792}, content_type='application/json')
+        self.assertEqual(response.json(), {'status': 'success', 'state': 'Lagos'})
+        self.assertEqual(self.client.session['user_state'], 'Lagos')
+
+    def test_capital_territory_matches_ppa_state(self):
+        # The polygon data calls it 'Fct'; PPA.state and the LGA list use 'Abuja'
+        self.assertEqual(get_state_from_coords(9.0579, 7.4951), 'Abuja')
+
+class PPARatingStatsTest(NyscTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(username='owner', password='testpass')
+        self.reviewers = [User.objects.create_user(username=f'reviewer{i}', password='testpass') for i in range(3)]
+        self.ppa = PPA.objects.create(
+            name='Test School', state='Lagos', lga='Ikeja', sector='Education',
+            address='1 Test Road', posted_by=self.owner
+        )
+
+    def test_stats_follow_review_changes(self):
+        first = PPAReview.objects.create(ppa=self.ppa, user=self.reviewers[0], rating=5)
+        PPAReview.objects.create(ppa=self.ppa, user=self.reviewers[1], rating=2)
+        self.ppa.refresh_from_db()
+        self.assertEqual((self.ppa.review_count, self.ppa.avg_rating), (2, 3.5))
+
+        first.rating = 4
+        first.save()
+        self.ppa.refresh_from_db()
+        self.assertEqual(self.ppa.avg_rating, 3.0)
+
+        first.delete()
+        self.ppa.refresh_from_db()
+        self.assertEqual((self.ppa.review_count, self.ppa.avg_rating), (1, 2.0))
+
+    def test_refresh_repairs_drift(self):
+        PPAReview.objects.create(ppa=self.ppa, user=self.reviewers[0], rating=4)
+        PPA.objects.filter(pk=self.ppa.pk).update(avg_rating=0, review_count=0)
+        PPA.objects.refresh_rating_stats()
+        self.ppa.refresh_from_db()
+        self.assertEqual((self.ppa.review_count, self.ppa.avg_rating), (1, 4.0))
+
+    def test_detail_page_pages_reviews_in_constant_queries(self):
+        def add_reviews(count, start):
+            for i in range(start, start + count):
+                user = User.objects.create_user(username=f'bulk{i}', password='testpass')
+                PPAReview.objects.create(ppa=self.ppa, user=user, rating=1 + i % 5, comment=f'Review {i}')
+
+        def get_detail(**params):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('ppa_detail', args=[self.ppa.id]), params)
+            return response, len(queries)
+
+        self.client.force_login(self.owner)
+        add_reviews(12, 0)
+        get_detail()  # first request of the session also writes last_seen
+        first, first_queries = get_detail()
+        self.assertEqual([r.comment for r in first.context['reviews']][:2], ['Review 11', 'Review 10'])
+        self.assertContains(first, 'Reviews (12)')
+        second, second_queries = get_detail(reviews_cursor=first.context['next_reviews_cursor'])
+        self.assertEqual([r.comment for r in second.context['reviews']], ['Review 1', 'Review 0'])
+        self.assertIsNone(second.context['next_reviews_cursor'])
+
+        add_reviews(30, 12)
+        _, more_queries = get_detail()
+        self.assertEqual(first_queries, second_queries)
+        self.assertEqual(first_queries, more_queries)
+
+class FeaturedPPATest(NyscTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(username='owner', password='testpass')
+        self.reviewer = User.objects.create_user(username='reviewer', password='testpass')
+        self.lagos = PPA.objects.create(
+            name='Lagos School', state='Lagos', lga='Ikeja', sector='Education',
+            address='1 Test Road', posted_by=self.owner, is_approved=True
+        )
+        self.kano = PPA.objects.create(
+            name='Kano Clinic', state='Kano', lga='Nassarawa', sector='Health',
+            address='2 Test Road', posted_by=self.owner, is_approved=True
+        )
+
+    def test_review_invalidates_cached_list(self):
+        self.assertEqual(get_featured_ppas('Lagos'), [])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            PPAReview.objects.create(ppa=self.kano, user=self.reviewer, rating=5)
+            # Not before commit, where a concurrent request would re-cache the old list
+            self.assertEqual(get_featured_ppas('Lagos'), [])
+        self.assertIn(invalidate_featured_ppas, callbacks)
+        self.assertEqual([ppa.id for ppa in get_featured_ppas()], [self.kano.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            PPAReview.objects.create(ppa=self.lagos, user=self.reviewer, rating=4)
+        # State list leads with local PPAs and is topped up from the national one
+        self.assertEqual([ppa.id for ppa in get_featured_ppas('Lagos')], [self.lagos.id, self.kano.id])
+
+class PPAFinderCursorTest(NyscTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(username='owner', password='testpass')
+        for i in range(19):
+            PPA.objects.create(
+                name=f'PPA {i}', state='Lagos', lga='Ikeja', sector='Education',
+                address=f'{i} Test Road', posted_by=self.owner, is_approved=True
+            )
+
+    def test_cursor_walk_covers_every_ppa_once(self):
+        first_page = self.client.get(reverse('ppa_finder'))
+        self.assertEqual(len(first_page.context['ppas']), 8)
+        seen, cursor = [], ''
+        while cursor is not None:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('ppa_finder'), {'cursor': cursor}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertFalse(any('COUNT(' in q['sql'] for q in queries.captured_queries))
+            data = response.json()
+            seen += [int(pk) for pk in re.findall(r'data-ppa-id="(\d+)"', data['html'])]
+            cursor = data['next_cursor']
+        expected = list(PPA.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(list(dict.fromkeys(seen)), expected)
+
+    def test_cards_follow_ratings_and_bookmarks(self):
+        reviewer = User.objects.create_user(username='reviewer', password='testpass')
+        ppa = PPA.objects.order_by('-created_at', '-id').first()
+        UserBookmark.objects.create(user=reviewer, ppa=ppa)
+        self.client.force_login(reviewer)
+        ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        with CaptureQueriesContext(connection) as queries:
+            html = self.client.get(reverse('ppa_finder'), {'cursor': ''}, **ajax).json()['html']
+        cold_queries = len(queries.captured_queries)
+        self.assertIn('0.0 stars', html)
+        self.assertEqual(html.count('fa-bookmark fas'), 1)
+
+        PPAReview.objects.create(ppa=ppa, user=reviewer, rating=5)
+        with CaptureQueriesContext(connection) as queries:
+            html = self.client.get(reverse('ppa_finder'), {'cursor': ''}, **ajax).json()['html']
+        self.assertIn('5.0 stars', html)
+        self.assertLessEqual(len(queries.captured_queries), cold_queries)
+
+    def test_page_count_cached_per_filter_until_catalog_changes(self):
+        def count_queries(params):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('ppa_finder'), params)
+            return response, sum('COUNT(' in q['sql'] and '"nysc_ppa"."is_approved"' in q['sql'] for q in queries.captured_queries)
+
+        self.client.force_login(self.owner)  # past the anonymous page cache
+        self.assertEqual(count_queries({'state': 'Lagos'})[1], 1)
+        self.assertEqual(count_queries({'state': 'Lagos'})[1], 0)
+        self.assertEqual(count_queries({'state': 'Lagos', 'sector': 'Education'})[1], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PPA.objects.create(
+                name='PPA 19', state='Lagos', lga='Ikeja', sector='Education',
+                address='19 Test Road', posted_by=self.owner, is_approved=True
+            )
+        response, counts = count_queries({'state': 'Lagos'})
+        self.assertEqual(counts, 1)
+        self.assertEqual(response.context['paginator'].count, 20)
+
+    def test_api_pages_projects_and_filters(self):
+        url = reverse('ppa_api')
+        seen, cursor = [], ''
+        while cursor is not None:
+            data = self.client.get(url, {'cursor': cursor, 'limit': 7, 'fields': 'id,name'}).json()
+            self.assertTrue(all(set(row) == {'id', 'name'} for row in data['results']))
+            seen += [row['id'] for row in data['results']]
+            cursor = data['next_cursor']
+        self.assertEqual(seen, list(PPA.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+        PPA.objects.filter(name='PPA 3').update(state='Kano')
+        data = self.client.get(url, {'state': 'Kano', 'q': 'ppa'}).json()
+        self.assertEqual([row['name'] for row in data['results']], ['PPA 3'])
+        self.assertIsNone(data['results'][0]['image'])
+        self.assertEqual(self.client.get(url, {'fields': 'id,password'}).status_code, 400)
+
+    def test_bad_cursor_is_rejected(self):
+        response = self.client.get(reverse('ppa_finder'), {'cursor': 'not-a-cursor'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 400)
+
+class PPASearchKeyTest(NyscTestCase):
+    def test_keys_follow_saves_and_drive_filters(self):
+        owner = User.objects.create_user(username='owner', password='testpass')
+        ppa = PPA.objects.create(
+            name='  Lagos   State School ', state='Lagos', lga='Ikeja', sector='Education',
+            address='1 Test Road', posted_by=owner, is_approved=True
+        )
+        self.assertEqual((ppa.name_key, ppa.lga_key), ('lagos state school', 'ikeja'))
+        ppa.lga = 'Ikorodu'
+        ppa.save(update_fields=['lga'])
+        ppa.refresh_from_db()
+        self.assertEqual(ppa.lga_key, 'ikorodu')
+
+        response = self.client.get(reverse('ppa_finder'), {'state': 'Lagos', 'sector': 'Education'})
+        self.assertEqual([p.id for p in response.context['ppas']], [ppa.id])
+
+        other = User.objects.create_user(username='other', password='testpass')
+        self.client.force_login(other)
+        response = self.client.get(reverse('check_duplicate_ppa'), {'name': 'LAGOS STATE SCHOOL', 'address': '1 test road'})
+        self.assertTrue(response.json()['is_duplicate'])
+
+
+class DuplicateDetectionTest(NyscTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(username='owner', password='testpass')
+        self.hospital = PPA.objects.create(
+            name='General Hospital Ikeja', state='Lagos', lga='Ikeja', sector='Health',
+            address='12 Obafemi Awolowo Way', posted_by=self.owner
+        )
+        PPA.objects.create(
+            name='General Hospital Ikeja', state='Kano', lga='Nassarawa', sector='Health',
+            address='4 Zoo Road', posted_by=self.owner
+        )
+        self.other = User.objects.create_user(username='other', password='testpass')
+        self.client.force_login(self.other)
+
+    def check(self, **params):
+        return self.client.get(reverse('check_duplicate_ppa'), params).json()
+
+    def test_ranked_near_matches_scoped_by_location(self):
+        data = self.check(name='Genral Hospital, Ikeja', address='12 Obafemi Awolowo Way Ikeja', state='Lagos', lga='ikeja')
+        self.assertFalse(data['is_duplicate'])
+        self.assertEqual([match['id'] for match in data['matches']], [self.hospital.id])
+        self.assertFalse(data['matches'][0]['exact'])
+        self.assertEqual(self.check(name='Ikeja Grammar School', address='3 School Road', state='Lagos', lga='Ikeja')['matches'], [])
+
+    def test_index_follows_commits_and_blocks_exact_submissions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hospital.address = '14 Obafemi Awolowo Way'
+            self.hospital.save()
+        data = self.check(name='general hospital ikeja', address='14 obafemi awolowo way', state='Lagos', lga='Ikeja')
+        self.assertTrue(data['is_duplicate'])
+        self.assertTrue(data['matches'][0]['exact'])
+
+        response = self.client.post(reverse('submit_ppa'), {
+            'name': 'General Hospital Ikeja', 'address': '14 Obafemi Awolowo Way', 'state': 'Lagos',
+            'lga': 'Ikeja', 'sector': 'Health', 'description': 'Duplicate'
+        }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(PPA.objects.filter(name_key='general hospital ikeja').count(), 2)
+
+
+def make_jpeg(name='upload.jpg', size=(1200, 600), exif=None):
+    output = io.BytesIO()
+    Image.new('RGB', size, color=(200, 40, 40)).save(output, format='JPEG', exif=exif or Image.Exif())
+    return SimpleUploadedFile(name, output.getvalue(), content_type='image/jpeg')
+
+
+def legacy_placeholder(char, reencodes=1):
+    """Bytes of an old per-PPA placeholder after the old PPA.save re-encoded it reencodes times."""
+    data = render_letter_avatar(char)
+    for _ in range(reencodes):
+        with Image.open(io.BytesIO(data)) as img:
+            width, height = img.size
+            if width / height < 3 / 2:
+                new_height = int(width / (3 / 2))
+                top = (height - new_height) // 2
+                img = img.crop((0, top, width, top + new_height))
+            elif width / height > 3 / 2:
+                new_width = int(height * 3 / 2)
+                left = (width - new_width) // 2
+                img = img.crop((left, 0, left + new_width, height))
+            output = io.BytesIO()
+            img.save(output, format='JPEG', quality=85)
+        data = output.getvalue()
+    return data
+
+
+class ImagePipelineTest(NyscTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, IMAGE_PROCESSING_ASYNC=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.owner = User.objects.create_user(username='owner', password='testpass')
+
+    def test_upload_is_processed_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ppa = PPA.objects.create(
+                name='Test School', state='Lagos', lga='Ikeja', sector='Education',
+                address='1 Test Road', posted_by=self.owner, image=make_jpeg()
+            )
+            original_name = ppa.image.name
+            self.assertEqual(PPA.objects.get(pk=ppa.pk).image_status, IMAGE_PENDING)
+        ppa.refresh_from_db()
+        self.assertEqual(ppa.image_status, IMAGE_READY)
+        self.assertTrue(ppa.image.name.endswith('_compressed.jpg'))
+        self.assertFalse(ppa.image.storage.exists(original_name))
+        with Image.open(ppa.image) as img:
+            self.assertEqual(img.size, (900, 600))
+        # 1200x600 crops to 900x600, too narrow for the 960w thumbnail
+        self.assertEqual(ppa.image_widths, [320, 640])
+        html = Template('{% load image_tags %}{% responsive_image ppa.image ppa.image_widths sizes="300px" alt=ppa.name %}').render(Context({'ppa': ppa}))
+        self.assertIn(f'/media/thumb/320x213/{ppa.image.name}?v=1 320w', html)
+        self.assertIn('alt="Test School"', html)
+
+        # Saving again without a new upload leaves the processed file alone
+        with self.captureOnCommitCallbacks(execute=True):
+            ppa.description = 'Updated'
+            ppa.save()
+        ppa.refresh_from_db()
+        self.assertTrue(ppa.image.name.endswith('_compressed.jpg'))
+        self.assertNotIn('_compressed_compressed', ppa.image.name)
+
+    @override_settings(IMAGE_PROCESSING_ASYNC=True)
+    def test_job_is_queued_durably_and_stranded_rows_are_requeued(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ppa = PPA.objects.create(
+                name='Test School', state='Lagos', lga='Ikeja', sector='Education',
+                address='1 Test Road', posted_by=self.owner, image=make_jpeg()
+            )
+        task = Task.objects.get(queue=IMAGE_QUEUE)
+        self.assertEqual(task.params()[0], ['nysc.ppa', ppa.pk, ppa.image.name])
+
+        # The job was lost (e.g. queued in-process before a restart); the row still says processing
+        task.delete()
+        for _ in range(2):  # a second run does not queue it twice
+            call_command('requeue_images', stdout=io.StringIO())
+        task = Task.objects.get(queue=IMAGE_QUEUE)
+        process_image_task.now(*task.params()[0])
+        ppa.refresh_from_db()
+        self.assertEqual(ppa.image_status, IMAGE_READY)
+        self.assertTrue(ppa.image.name.endswith('_compressed.jpg'))
+
+    def test_profile_picture_processed_only_when_replaced(self):
+        profile = self.owner.profile
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.profile_picture = make_jpeg('me.jpg', size=(800, 800))
+            profile.save()
+        stale = profile  # still holds the upload's name; the job swapped the processed file in
+        profile = UserProfile.objects.get(pk=profile.pk)
+        processed = profile.profile_picture.name
+        self.assertEqual((profile.picture_status, profile.picture_widths), (IMAGE_READY, [64, 160, 320, 600]))
+
+        with mock.patch('nysc.images.enqueue_image') as enqueue, self.captureOnCommitCallbacks(execute=True):
+            profile.last_seen = timezone.now()
+            profile.save(update_fields=['last_seen'])
+            self.owner.save()  # save_user_profile re-saves the profile
+            stale.bio = 'Corps member'
+            stale.save()
+        enqueue.assert_not_called()
+        profile.refresh_from_db()
+        self.assertEqual((profile.profile_picture.name, profile.bio), (processed, 'Corps member'))
+
+        self.assertEqual(self.client.get(thumbnail_url(processed, 64)).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.profile_picture = make_jpeg('new.jpg')
+            profile.save()
+        storage = profile.profile_picture.storage
+        self.assertFalse(storage.exists(processed))
+        self.assertFalse(os.path.exists(thumbnail_path(processed, (64, 64), 'jpeg')))
+
+    def test_image_less_ppas_share_letter_avatars(self):
+        self.client.force_login(self.owner)
+        for name in ('Apapa Port', 'apex bank', '  9mobile Office'):
+            self.client.post(reverse('submit_ppa'), {
+                'name': name, 'address': f'{name} Road', 'state': 'Lagos', 'lga': 'Ikeja', 'sector': 'Private'
+            }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        images = dict(PPA.objects.values_list('name', 'image'))
+        self.assertEqual(images['Apapa Port'], images['apex bank'])
+        self.assertTrue(images['Apapa Port'].startswith(f"{AVATAR_DIR}/A-"))
+        self.assertTrue(images['9mobile Office'].startswith(f"{AVATAR_DIR}/9-"))
+        self.assertEqual(len(default_storage.listdir(AVATAR_DIR)[1]), 2)
+
+    def test_relink_replaces_legacy_avatar_chain(self):
+        # The old form wrote <name>_avatar.jpg and each old PPA.save re-encoded it under a new _compressed name
+        chain = [default_storage.save(name, io.BytesIO(legacy_placeholder('A', reencodes))) for reencodes, name in enumerate((
+            'ppa_images/Apapa Port_avatar.jpg',
+            'ppa_images/Apapa Port_avatar_compressed.jpg',
+            'ppa_images/Apapa Port_avatar_compressed_compressed.jpg',
+        ))]
+        ppa = PPA.objects.create(name='Apapa Port', state='Lagos', lga='Apapa', sector='Private',
+                                 address='1 Port Road', posted_by=self.owner)
+        PPA.objects.filter(pk=ppa.pk).update(image=chain[-1])
+        upload = PPA.objects.create(name='Avatar Studio', state='Lagos', lga='Ikeja', sector='Private',
+                                    address='2 Test Road', posted_by=self.owner)
+        PPA.objects.filter(pk=upload.pk).update(image='ppa_images/studio_avatars.jpg')
+
+        call_command('generate_letter_avatars', '--relink', stdout=io.StringIO())
+        ppa.refresh_from_db()
+        self.assertTrue(ppa.image.name.startswith(f"{AVATAR_DIR}/A-"))
+        self.assertEqual([default_storage.exists(name) for name in chain], [False, False, False])
+        self.assertEqual(PPA.objects.get(pk=upload.pk).image.name, 'ppa_images/studio_avatars.jpg')
+
+    def test_relink_keeps_real_photos_named_like_legacy_avatars(self):
+        output = io.BytesIO()
+        Image.radial_gradient('L').resize((200, 133)).convert('RGB').save(output, format='JPEG')
+        photo = default_storage.save('ppa_images/my_avatar_compressed.jpg', output)
+        original = default_storage.save('ppa_images/my_avatar.jpg', io.BytesIO(legacy_placeholder('M', 0)))
+        ppa = PPA.objects.create(name='My School', state='Lagos', lga='Ikeja', sector='Education',
+                                 address='3 Test Road', posted_by=self.owner)
+        PPA.objects.filter(pk=ppa.pk).update(image=photo)
+
+        out = io.StringIO()
+        with self.assertLogs('nysc.management.commands.generate_letter_avatars', 'WARNING'):
+            call_command('generate_letter_avatars', '--relink', stdout=out)
+        self.assertEqual(PPA.objects.get(pk=ppa.pk).image.name, photo)
+        self.assertTrue(default_storage.exists(photo))
+        self.assertTrue(default_storage.exists(original))
+        self.assertIn('Skipped 1', out.getvalue())
+
+    def test_large_jpeg_decodes_once_at_reduced_scale(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # stored landscape, displayed portrait
+        source = make_jpeg(size=(4000, 3000), exif=exif)
+        # 1/2 scale is the smallest that still covers 960 px of 3:2 crop once the image is turned upright
+        self.assertEqual(open_scaled(source, (960, 640)).size, (1500, 2000))
+        source.seek(0)
+        master, size = ingest_image(source, (1280, 1280), 85, 3 / 2)
+        with Image.open(io.BytesIO(master)) as img:
+            self.assertEqual(img.size, size)
+        self.assertEqual(size, (1280, 853))
+
+    def test_thumbnail_endpoint_caches_and_revalidates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ppa = PPA.objects.create(
+                name='Test School', state='Lagos', lga='Ikeja', sector='Education',
+                address='1 Test Road', posted_by=self.owner, image=make_jpeg()
+            )
+        ppa.refresh_from_db()
+        url = thumbnail_url(ppa.image.name, 640)
+        response = self.client.get(url, HTTP_ACCEPT='image/avif,image/webp,*/*')
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/webp'))
+        self.assertIn('immutable', response['Cache-Control'])
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as img:
+            self.assertEqual(img.size, (640, 427))
+
+        with mock.patch('nysc.images.render_thumbnail', side_effect=render_thumbnail) as render:
+            again = self.client.get(url, HTTP_ACCEPT='image/webp', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(again.status_code, 304)
+            jpeg = self.client.get(url, HTTP_ACCEPT='*/*')
+            self.assertEqual(jpeg.status_code, 200)
+            render.assert_called_once()  # only the JPEG rendition was new
+        self.assertNotEqual(jpeg['ETag'], response['ETag'])
+
+        # A rendering change gets a new URL and re-renders, rather than re-labelling the cached bytes
+        with mock.patch('nysc.images.THUMBNAIL_VERSION', 2), \
+                mock.patch('nysc.images.render_thumbnail', side_effect=render_thumbnail) as render:
+            bumped_url = thumbnail_url(ppa.image.name, 640)
+            bumped = self.client.get(bumped_url, HTTP_ACCEPT='*/*')
+            render.assert_called_once()
+        self.assertNotEqual(bumped_url, url)
+        self.assertNotEqual(bumped['ETag'], jpeg['ETag'])
+        self.assertEqual(self.client.get(f'/media/thumb/500x500/{ppa.image.name}').status_code, 404)
+        self.assertEqual(self.client.get('/media/thumb/320x213/ppa_images/../../settings.py').status_code, 404)
+
+    def test_thumbnail_of_directory_or_undecodable_file_is_404(self):
+        default_storage.save(f'{AVATAR_DIR}/keep.jpg', io.BytesIO(make_jpeg().read()))
+        broken = default_storage.save('ppa_images/broken.jpg', io.BytesIO(b'not an image'))
+        with self.assertLogs('nysc.views', 'WARNING'):
+            self.assertEqual(self.client.get(f'/media/thumb/320x213/{AVATAR_DIR}').status_code, 404)
+        with self.assertLogs('nysc.views', 'WARNING'):
+            self.assertEqual(self.client.get(f'/media/thumb/320x213/{broken}').status_code, 404)
+
+    def test_thumbnail_cache_evicts_least_recently_used(self):
+        storage = default_storage
+        names = [storage.save(f'ppa_images/t{i}.jpg', make_jpeg(size=(640, 427))) for i in range(3)]
+        _thumbnail_cache.total = None
+        paths = []
+        for name in names[:2]:
+            paths.append(get_thumbnail(storage, name, (320, 213), 'jpeg'))
+        os.utime(paths[0], (1, 1))  # long unused
+        with override_settings(THUMBNAIL_CACHE_MAX_BYTES=int(os.path.getsize(paths[1]) * 2.5)):
+            paths.append(get_thumbnail(storage, names[2], (320, 213), 'jpeg'))
+        _thumbnail_cache.total = None
+        self.assertEqual([os.path.exists(path) for path in paths], [False, True, True])
+
+
+class VerificationQueueTest(NyscTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.owner = User.objects.create_user(username='owner', password='testpass')
+        self.ppa = PPA.objects.create(
+            name='Test School', state='Lagos', lga='Ikeja', sector='Education',
+            address='1 Test Road', posted_by=self.owner
+        )
+        self.client.login(username='owner', password='testpass')
+
+    def test_request_queues_ocr_and_status_reports_result(self):
+        status_url = reverse('ppa_verification_status', kwargs={'ppa_id': self.ppa.id})
+        with mock.patch('nysc.tasks.pytesseract.image_to_string') as ocr:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse('request_ppa_verification', kwargs={'ppa_id': self.ppa.id}),
+                    {'verification_document': make_jpeg('letter.jpg')},
+                    HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+                )
+            ocr.assert_not_called()
+        data = response.json()
+        self.assertEqual((data['verification_status'], data['processing']), ('pending', True))
+        self.assertEqual(data['status_url'], status_url)
+        task = Task.objects.get(queue=VERIFICATION_QUEUE)
+        ppa_id, document_name = task.params()[0]
+        self.assertEqual((ppa_id, document_name), (self.ppa.id, PPA.objects.get(pk=self.ppa.pk).verification_document.name))
+        self.assertTrue(self.client.get(status_url).json()['processing'])
+
+        with mock.patch('nysc.tasks.pytesseract.image_to_string', return_value='Posting letter: TEST SCHOOL, Lagos State'):
+            with self.captureOnCommitCallbacks(execute=True):
+                verify_ppa_document_task.now(ppa_id, document_name)
+        self.ppa.refresh_from_db()
+        self.assertEqual((self.ppa.verified, self.ppa.verification_status, self.ppa.verification_ocr_status), (True, 'approved', 'done'))
+        self.assertFalse(self.ppa.verification_document)
+        self.assertFalse(default_storage.exists(document_name))
+        self.assertEqual(LeaderboardEntry.objects.get(user=self.owner).verified_ppas, 1)
+        self.assertEqual(self.client.get(status_url).json(), {
+            'status': 'success', 'verified': True, 'verification_status': 'approved', 'processing': False
+        })
+
+    def test_request_for_approved_ppa_is_refused(self):
+        PPA.objects.filter(pk=self.ppa.pk).update(verified=True, verification_status='approved')
+        response = self.client.post(
+            reverse('request_ppa_verification', kwargs={'ppa_id': self.ppa.id}),
+            {'verification_document': make_jpeg('letter.jpg')},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], 'This PPA is already verified.')
+        self.ppa.refresh_from_db()
+        self.assertFalse(self.ppa.verification_document)
+        self.assertFalse(Task.objects.filter(queue=VERIFICATION_QUEUE).exists())
+
+    def test_cached_card_follows_verified_flag(self):
+        def render_card():
+            ppa = PPA.objects.select_related('posted_by__profile').get(pk=self.ppa.pk)
+            return render_to_string('nysc/ppa_card.html', {'ppa': ppa, 'bookmarked_ppa_ids': set()})
+
+        self.assertNotIn('verified-icon', render_card())
+        # A bulk update that leaves updated_at alone must still show up on the card
+        PPA.objects.filter(pk=self.ppa.pk).update(verified=True)
+        self.assertIn('verified-icon', render_card())
+
+    @override_settings(VERIFICATION_OCR_ASYNC=False)
+    def test_unconfirmed_document_waits_for_manual_review(self):
+        with mock.patch('nysc.tasks.pytesseract.image_to_string', return_value='an unrelated receipt'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.ppa.verification_document = make_jpeg('letter.jpg')
+                self.ppa.save()
+        self.ppa.refresh_from_db()
+        self.assertEqual((self.ppa.verified, self.ppa.verification_status, self.ppa.verification_ocr_status), (False, 'pending', 'done'))
+        self.assertTrue(default_storage.exists(self.ppa.verification_document.name))
+        self.assertFalse(self.ppa.verification_processing)
+
+        # A result for a document an admin has already rejected is thrown away
+        PPA.objects.filter(pk=self.ppa.pk).update(verification_status='rejected', verification_ocr_status='queued')
+        with mock.patch('nysc.tasks.pytesseract.image_to_string', return_value='test school lagos'):
+            verify_ppa_document_task.now(self.ppa.id, self.ppa.verification_document.name)
+        self.ppa.refresh_from_db()
+        self.assertEqual((self.ppa.verified, self.ppa.verification_status), (False, 'rejected'))
+
+
+class PPAFullTextSearchTest(NyscTestCase):
+    def setUp(self):
+        super().setUp()
+        owner = User.objects.create_user(username='owner', password='testpass')
+        rows = [
+            ('General Hospital Ikeja', 'Lagos', 'Ikeja', 'Health', 'Teaching hospital'),
+            ('Ikeja Grammar School', 'Lagos', 'Ikeja', 'Education', 'Secondary school near the hospital'),
+            ('Kano General Hospital', 'Kano', 'Nassarawa', 'Health', ''),
+        ]
+        self.ppas = {}
+        for name, state, lga, sector, description in rows:
+            self.ppas[name] = PPA.objects.create(
+                name=name, state=state, lga=lga, sector=sector, description=description,
+                address=f'{name} Road', posted_by=owner, is_approved=True
+            )
+
+    def search(self, **params):
+        response = self.client.get(reverse('ppa_finder'), params)
+        return [ppa.name for ppa in response.context['ppas']]
+
+    def test_ranked_prefix_search_combines_with_filters(self):
+        self.assertEqual(len(self.search(q='hosp')), 3)
+        names = self.search(q='hosp ikeja')
+        self.assertEqual(names[0], 'General Hospital Ikeja')
+        self.assertEqual(set(names), {'General Hospital Ikeja', 'Ikeja Grammar School'})
+        self.assertEqual(self.search(q='hospital', state='Kano'), ['Kano General Hospital'])
+        # FTS5 syntax in user input is treated as plain words
+        self.assertEqual(self.search(q='name:"kano" OR'), [])
+
+    def test_index_follows_bulk_updates(self):
+        PPA.objects.filter(pk=self.ppas['Kano General Hospital'].pk).update(name='Kano Specialist Clinic', address='1 Zoo Road')
+        self.assertEqual(self.search(q='clinic'), ['Kano Specialist Clinic'])
+        self.assertEqual(self.search(q='general'), ['General Hospital Ikeja'])
+
+    def test_search_queryset_composes_as_subquery(self):
+        matches = search_ppas(PPA.objects.all(), 'hospital').filter(state='Lagos')
+        self.assertEqual(matches[0].name, 'General Hospital Ikeja')
+        self.assertIsNotNone(matches[0].search_rank)
+        # Sliced, so the inner query keeps its ORDER BY on the rank
+        best = PPA.objects.filter(id__in=matches.values('id')[:1])
+        self.assertEqual(list(best.values_list('name', flat=True)), ['General Hospital Ikeja'])
+        self.assertEqual(PPA.objects.filter(id__in=matches.values('id')).exclude(sector='Education').count(), 1)
+
+
+class FacetCountTest(NyscTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(username='owner', password='testpass')
+
+    def create(self, **fields):
+        defaults = dict(lga='Ikeja', sector='Education', posted_by=self.owner, is_approved=True)
+        defaults.update(fields)
+        with self.captureOnCommitCallbacks(execute=True):
+            return PPA.objects.create(**defaults)
+
+    def test_counts_are_disjunctive_and_follow_changes(self):
+        get_facet_index()
+        self.create(name='A', address='1', state='Lagos', stipend=60000, accommodation_available=True)
+        self.create(name='B', address='2', state='Lagos', sector='Health', stipend=10000)
+        kano = self.create(name='C', address='3', state='Kano', lga='Nassarawa', stipend=120000)
+        self.create(name='D', address='4', state='Kano', lga='Nassarawa', is_approved=False)
+
+        counts = get_facet_index().counts({'state': 'Lagos', 'sector': 'Education'})
+        self.assertEqual(counts['state']['Lagos'], 1)
+        self.assertEqual(counts['state']['Kano'], 1)
+        self.assertEqual(counts['sector'], {'Education': 1, 'Health': 1})
+        self.assertEqual(counts['min_stipend']['50000'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            kano.delete()
+        index = get_facet_index()
+        self.assertEqual(index.counts({})['state']['Kano'], 0)
+        self.assertEqual(index.all, FacetIndex.build().all)
+
+        response = self.client.get(reverse('ppa_finder'), {'state': 'Lagos'})
+        labels = dict(response.context['form'].fields['sector'].choices)
+        self.assertEqual(labels['Health'], 'Health (1)')
+
+    def test_counts_follow_default_user_state_filter(self):
+        self.create(name='A', address='1', state='Lagos', sector='Health')
+        self.create(name='B', address='2', state='Kano', lga='Nassarawa', sector='Health')
+        session = self.client.session
+        session['user_state'] = 'Lagos'
+        session.save()
+        # No filters submitted: the listing narrows to the visitor's state, and so do the counts
+        response = self.client.get(reverse('ppa_finder'))
+        self.assertEqual([ppa.name for ppa in response.context['ppas']], ['A'])
+        labels = dict(response.context['form'].fields['sector'].choices)
+        self.assertEqual(labels['Health'], 'Health (1)')
+
+    def test_change_from_another_process_forces_rebuild(self):
+        first = self.create(name='A', address='1', state='Lagos')
+        index = get_facet_index()
+        # Another worker commits a PPA: its own bump is the only trace this process sees
+        other = PPA.objects.create(name='B', address='2', state='Kano', lga='Nassarawa', sector='Health',
+                                   posted_by=self.owner, is_approved=True)
+        other_version = bump_catalog_version()
+        self.assertEqual(other_version, index.version + 1)
+        mine = self.create(name='C', address='3', state='Lagos')
+        # Versions are unique, so the local change is not patched over the missed one
+        self.assertEqual(index.version, other_version - 1)
+        self.assertEqual(get_facet_index().counts({})['state']['Kano'], 1)
+        self.assertEqual(set(get_facet_index().members), {first.id, other.id, mine.id})
+
+
+class AnonymousPageCacheTest(NyscTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user(username='owner', password='testpass')
+        self.ppa = PPA.objects.create(
+            name='Cached School', state='Lagos', lga='Ikeja', sector='Education',
+            address='1 Test Road', posted_by=self.owner, is_approved=True
+        )
+
+    def test_pages_are_shared_until_tagged_models_change(self):
+        url = reverse('ppa_finder')
+        first = self.client.get(url, {'state': 'Lagos'})
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        second = self.client.get(url, {'state': 'Lagos', 'sector': ''})
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertNotIn(CSRF_SENTINEL, second.content.decode())
+        self.assertIn('Cached School', second.content.decode())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PPAReview.objects.create(ppa=self.ppa, user=self.owner, rating=5)
+        # Another worker holds the rebuild lock: the stale copy is served meanwhile
+        cache.add(f"{PPAListView().page_cache_key(second.wsgi_request)}:lock", 1)
+        self.assertEqual(self.client.get(url, {'state': 'Lagos'})['X-Page-Cache'], 'stale')
+        cache.delete(f"{PPAListView().page_cache_key(second.wsgi_request)}:lock")
+        rebuilt = self.client.get(url, {'state': 'Lagos'})
+        self.assertEqual(rebuilt['X-Page-Cache'], 'miss')
+        self.assertIn('5.0 stars', rebuilt.content.decode())
+
+        self.client.force_login(self.owner)
+        self.assertFalse(self.client.get(url, {'state': 'Lagos'}).has_header('X-Page-Cache'))
+
+
+class BookmarkSetTest(NyscTestCase):
+    def test_bookmark_state_costs_one_query_per_request(self):
+        user = User.objects.create_user(username='owner', password='testpass')
+        for i in range(5):
+            ppa = PPA.objects.create(
+                name=f'PPA {i}', state='Lagos', lga='Ikeja', sector='Education',
+                address=f'{i} Test Road', posted_by=user, is_approved=True
+            )
+            if i % 2 == 0:
+                UserBookmark.objects.create(user=user, ppa=ppa)
+        self.client.force_login(user)
+        for url in (reverse('ppa_finder'), reverse('bookmarks_list')):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            lookups = [q for q in queries.captured_queries if 'SELECT "nysc_userbookmark"."ppa_id"' in q['sql']]
+            self.assertEqual(len(lookups), 1)
+            self.assertEqual(response.content.decode().count('fa-bookmark fas'), 3)
+
 if __name__ == '__main__':
     import django
     django.setup()
@@ -3,10 +3,10 @@
 
 from django.urls import path, include
 from .views import (
-    PPAListView, PPADetailView, submit_ppa, submit_review, register,
+    PPAListView, PPADetailView, ppa_api, thumbnail, submit_ppa, submit_review, register,
     verify_email, forgot_password, resend_verification, CustomPasswordResetConfirmView,
-    set_user_state, profile_view, profile_edit, ppa_edit, CustomLoginView, follow_user, unfollow_user, 
-    request_ppa_verification, leaderboard, check_notifications, notifications, clear_notifications, mark_notifications_read, delete_review, marketplace_coming_soon, marketplace_subscribe,
+    set_user_state, states_from_coords, profile_view, profile_edit, ppa_edit, CustomLoginView, follow_user, unfollow_user, 
+    request_ppa_verification, ppa_verification_status, leaderboard, check_notifications, notifications, clear_notifications, mark_notifications_read, delete_review, marketplace_coming_soon, marketplace_subscribe,
     marketplace_feedback, bookmarks_list, toggle_bookmark, check_bookmark, camp_info, delete_ppa, check_duplicate_ppa, health_check
 
 )
@@ -16,6 +16,8 @@ from django.contrib.auth.views import LogoutView
 urlpatterns = [
     path('', PPAListView.as_view(), name='ppa_finder'),
     path('ppa/<int:pk>/', PPADetailView.as_view(), name='ppa_detail'),
+    path('api/ppas/', ppa_api, name='ppa_api'),
+    path('media/thumb/<int:width>x<int:height>/<path:name>', thumbnail, name='thumbnail'),
     path('submit-ppa/', submit_ppa, name='submit_ppa'),
     path('ppa/<int:ppa_id>/review/', submit_review, name='submit_review'),
     path('ppa/<int:ppa_id>/delete_review/', delete_review, name='delete_review'),
@@ -25,6 +27,7 @@ urlpatterns = [
     path('verify-email/<uuid:token>/', verify_email, name='verify_email'),
     path('check-duplicate-ppa/', check_duplicate_ppa, name='check_duplicate_ppa'),
     path('set_user_state/', set_user_state, name='set_user_state'),
+    path('states_from_coords/', states_from_coords, name='states_from_coords'),
     path('forgot-password/', forgot_password, name='forgot_password'),
     path('resend-verification/', resend_verification, name='resend_verification'),
     path('password-reset-confirm/<uuid:token>/', CustomPasswordResetConfirmView.as_view(), name='password_reset_confirm'),
@@ -36,6 +39,7 @@ urlpatterns = [
     path('profile/<str:username>/follow/', follow_user, name='follow_user'),
     path('profile/<str:username>/unfollow/', unfollow_user, name='unfollow_user'),
     path('ppa/<int:ppa_id>/verify/', request_ppa_verification, name='request_ppa_verification'),
+    path('ppa/<int:ppa_id>/verification-status/', ppa_verification_status, name='ppa_verification_status'),
     path('leaderboard/', leaderboard, name='leaderboard'),  
     path('notifications/', notifications, name='notifications'),
     path('check-notifications/', check_notifications, name='check_notifications'),
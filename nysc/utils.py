@@ -3,24 +3,97 @@ from pathlib import Path
 import os
 import logging
 import gzip
+import math
+import functools
+import threading
 import geojson
+import numpy as np
+import shapely
+from shapely import STRtree
 from shapely.geometry import shape, Point
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 
 logger = logging.getLogger(__name__)
 
 # Define BASE_DIR to match settings.py
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-def load_states_geojson():
-    static_path = os.path.join(BASE_DIR, 'static', 'nysc', 'json', 'nigeria_states.geojson.gz')
-    if not os.path.exists(static_path):
-        static_path = os.path.join(settings.STATIC_ROOT, 'nysc', 'json', 'nigeria_states.geojson.gz')
-        if not os.path.exists(static_path):
-            logger.error(f"GeoJSON file not found at {static_path}")
-            return []
+def normalize_text(value):
+    """Case- and whitespace-insensitive key used for indexed equality lookups."""
+    return ' '.join((value or '').split()).casefold()
+
+CATALOG_VERSION_ID = 1
+
+def catalog_version():
+    """Shared counter bumped on every PPA catalogue change; process-local caches compare against it."""
+    from .models import CatalogVersion
+    version = CatalogVersion.objects.filter(id=CATALOG_VERSION_ID).values_list('version', flat=True).first()
+    return 1 if version is None else version
+
+def bump_catalog_version():
+    """
+    Give this change its own version. The UPDATE is atomic and holds the row's write lock until the
+    transaction ends, so reading the value back sees only our increment, even with several processes
+    committing at once. CatalogIndex.apply relies on that to patch in place.
+    """
+    from .models import CatalogVersion
+    rows = CatalogVersion.objects.filter(id=CATALOG_VERSION_ID)
+    with transaction.atomic():
+        # Update before any read, so SQLite takes the write lock up front instead of upgrading a read lock
+        if not rows.update(version=F('version') + 1):
+            CatalogVersion.objects.get_or_create(id=CATALOG_VERSION_ID)
+            rows.update(version=F('version') + 1)
+        return rows.values_list('version', flat=True).get()
+
+_catalog_indexes = []
+
+class CatalogIndex:
+    """
+    Process-resident index over the PPA catalogue. build(version) makes a fresh index; changes
+    committed in this process are patched in through update(ppa_id, ppa), and a catalog version
+    moved on by another process triggers a rebuild on the next get().
+    """
+
+    def __init__(self, build):
+        self.build = build
+        self.index = None
+        self.lock = threading.Lock()
+        _catalog_indexes.append(self)
+
+    def get(self):
+        version = catalog_version()
+        if self.index is None or self.index.version != version:
+            with self.lock:
+                if self.index is None or self.index.version != version:
+                    self.index = self.build(version)
+        return self.index
+
+    def apply(self, ppa_id, ppa, new_version):
+        # Patch in place only if this process was current right before this change
+        with self.lock:
+            if self.index is None or self.index.version != new_version - 1:
+                return
+            self.index.update(ppa_id, ppa)
+            self.index.version = new_version
+
+def reset_catalog_indexes():
+    """Drop every process-resident index; each rebuilds on its next get()."""
+    for index in _catalog_indexes:
+        with index.lock:
+            index.index = None
+
+def record_ppa_change(ppa_id, ppa=None):
+    """Bump the catalog version for a committed save (ppa) or delete (ppa=None) and patch local indexes."""
+    version = bump_catalog_version()
+    for index in _catalog_indexes:
+        index.apply(ppa_id, ppa, version)
+
+def load_geojson_features(path):
+    opener = gzip.open if str(path).endswith('.gz') else open
     try:
-        with gzip.open(static_path, 'rt', encoding='utf-8') as f:
+        with opener(path, 'rt', encoding='utf-8') as f:
             data = geojson.load(f)
             logger.debug(f"Loaded GeoJSON with {len(data['features'])} features")
             return data['features']
@@ -28,30 +101,252 @@ def load_states_geojson():
         logger.error(f"Error loading GeoJSON: {str(e)}", exc_info=True)
         return []
 
-def get_state_from_coords(lat, lon):
-    point = Point(float(lon), float(lat))  # [lon, lat] order for Shapely
-    logger.debug(f"Checking point: {point} with coords {lat}, {lon}")
-    features = load_states_geojson()
-    if not features:
-        logger.error("No GeoJSON features loaded")
+def load_states_geojson():
+    static_path = os.path.join(BASE_DIR, 'static', 'nysc', 'json', 'nigeria_states.geojson.gz')
+    if not os.path.exists(static_path):
+        static_path = os.path.join(settings.STATIC_ROOT, 'nysc', 'json', 'nigeria_states.geojson.gz')
+        if not os.path.exists(static_path):
+            logger.error(f"GeoJSON file not found at {static_path}")
+            return []
+    return load_geojson_features(static_path)
+
+class PolygonIndex:
+    """Point-in-polygon lookups over a fixed set of named polygons.
+
+    Geometries are prepared once and kept behind an STRtree, so a lookup only
+    runs the exact ``contains`` test against the few polygons whose bounding
+    box holds the point. An optional interior grid answers points in cells
+    that lie wholly inside one polygon without touching geometry code.
+    """
+
+    def __init__(self, geometries, names, grid=None, grid_origin=None, grid_cell_size=None):
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.names = list(names)
+        shapely.prepare(self.geometries)
+        self.tree = STRtree(self.geometries)
+        self.grid = grid
+        self.grid_origin = grid_origin
+        self.grid_cell_size = grid_cell_size
+
+    def __len__(self):
+        return len(self.names)
+
+    def grid_lookup(self, lon, lat):
+        if self.grid is None:
+            return None
+        col = math.floor((lon - self.grid_origin[0]) / self.grid_cell_size)
+        row = math.floor((lat - self.grid_origin[1]) / self.grid_cell_size)
+        if 0 <= row < self.grid.shape[0] and 0 <= col < self.grid.shape[1]:
+            i = self.grid[row, col]
+            if i >= 0:
+                return self.names[i]
         return None
 
+    def lookup(self, lon, lat):
+        state = self.grid_lookup(lon, lat)
+        if state is not None:
+            return state
+        point = Point(lon, lat)
+        # Sorted so overlapping features resolve in file order, as before
+        for i in np.sort(self.tree.query(point)):
+            if self.geometries[i].contains(point):
+                return self.names[i]
+        return None
+
+    def lookup_many(self, lons, lats):
+        xs = np.asarray(lons, dtype=float)
+        ys = np.asarray(lats, dtype=float)
+        matches = np.full(len(xs), -1, dtype=np.int64)
+        if self.grid is not None:
+            with np.errstate(invalid='ignore'):
+                cols = np.floor((xs - self.grid_origin[0]) / self.grid_cell_size)
+                rows = np.floor((ys - self.grid_origin[1]) / self.grid_cell_size)
+                on_grid = (cols >= 0) & (cols < self.grid.shape[1]) & (rows >= 0) & (rows < self.grid.shape[0])
+            matches[on_grid] = self.grid[rows[on_grid].astype(np.int64), cols[on_grid].astype(np.int64)]
+        pending = np.flatnonzero(matches == -1)
+        # One bounding-box query for the points left over, then one vectorized
+        # contains_xy call per candidate polygon (in file order).
+        point_idx, geom_idx = self.tree.query(shapely.points(xs[pending], ys[pending]))
+        point_idx = pending[point_idx]
+        for i in np.unique(geom_idx):
+            candidates = point_idx[geom_idx == i]
+            candidates = candidates[matches[candidates] == -1]
+            if len(candidates):
+                hits = shapely.contains_xy(self.geometries[i], xs[candidates], ys[candidates])
+                matches[candidates[hits]] = i
+        return [self.names[i] if i >= 0 else None for i in matches]
+
+
+def build_interior_grid(geometries, cell_size):
+    """Mark every grid cell that lies wholly inside one polygon.
+
+    Returns (grid, origin) where grid[row, col] is the polygon index for such
+    cells and -1 for cells on a border or outside every polygon.
+    """
+    xmin, ymin, xmax, ymax = shapely.total_bounds(geometries)
+    cols = math.ceil((xmax - xmin) / cell_size)
+    rows = math.ceil((ymax - ymin) / cell_size)
+    grid = np.full((rows, cols), -1, dtype=np.int16)
+    for i, geometry in enumerate(geometries):
+        gxmin, gymin, gxmax, gymax = geometry.bounds
+        col_range = np.arange(int((gxmin - xmin) // cell_size), min(cols, int((gxmax - xmin) // cell_size) + 1))
+        row_range = np.arange(int((gymin - ymin) // cell_size), min(rows, int((gymax - ymin) // cell_size) + 1))
+        col_idx, row_idx = np.meshgrid(col_range, row_range)
+        x0 = xmin + col_idx * cell_size
+        y0 = ymin + row_idx * cell_size
+        # contains_properly keeps cells that touch a border out of the grid
+        inside = shapely.contains_properly(geometry, shapely.box(x0, y0, x0 + cell_size, y0 + cell_size))
+        grid[row_idx[inside], col_idx[inside]] = i
+    return grid, (xmin, ymin)
+
+
+# The source data names the capital territory differently from PPA.state
+STATE_NAME_ALIASES = {'Fct': 'Abuja'}
+
+def compile_geometry(features, name_property, tolerance=0.0, aliases=None):
+    """Return (geometries, names) from GeoJSON features, optionally simplified."""
+    aliases = aliases or {}
+    geometries = []
+    names = []
     for feature in features:
         if 'geometry' in feature and feature['geometry']:
             try:
-                polygon = shape(feature['geometry'])
-                # Round coordinates to 4 decimal places for consistency
-                point_rounded = Point(round(float(lon), 4), round(float(lat), 4))
-                if polygon.contains(point_rounded):
-                    state = feature['properties'].get('statename')
-                    logger.info(f"Found state: {state} for coordinates {lat}, {lon}")
-                    return state
+                geometries.append(shape(feature['geometry']))
+                name = feature['properties'].get(name_property)
+                names.append(aliases.get(name, name))
             except Exception as e:
                 logger.error(f"Error processing polygon for feature {feature.get('properties', {})}: {str(e)}", exc_info=True)
-                continue
+    geometries = np.asarray(geometries, dtype=object)
+    if tolerance and len(geometries):
+        geometries = shapely.simplify(geometries, tolerance, preserve_topology=True)
+    return geometries, names
+
+def compile_state_geometry(tolerance=0.0):
+    return compile_geometry(load_states_geojson(), 'statename', tolerance, STATE_NAME_ALIASES)
+
+def save_geometry(path, geometries, names, tolerance=0.0, grid_cell_size=0.0):
+    # Polygons are stored as flat coordinate/offset arrays (shapely's ragged
+    # array layout), which load without any JSON or WKB parsing.
+    geometry_type, coords, offsets = shapely.to_ragged_array(geometries)
+    arrays = {f'offsets_{i}': offset for i, offset in enumerate(offsets)}
+    if grid_cell_size:
+        grid, origin = build_interior_grid(geometries, grid_cell_size)
+        arrays.update(grid=grid, grid_origin=np.asarray(origin), grid_cell_size=np.float64(grid_cell_size))
+    np.savez_compressed(
+        path,
+        geometry_type=np.int8(geometry_type),
+        coords=coords,
+        names=np.asarray(names, dtype=str),
+        tolerance=np.float64(tolerance),
+        **arrays
+    )
+
+def load_geometry(path):
+    """Return a compiled artifact as a dict of PolygonIndex arguments, or None."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            offset_keys = sorted(key for key in data.files if key.startswith('offsets_'))
+            compiled = {
+                'geometries': shapely.from_ragged_array(
+                    shapely.GeometryType(int(data['geometry_type'])),
+                    data['coords'],
+                    tuple(data[key] for key in offset_keys)
+                ),
+                'names': data['names'].tolist(),
+            }
+            if 'grid' in data.files:
+                compiled['grid'] = data['grid']
+                compiled['grid_origin'] = tuple(data['grid_origin'].tolist())
+                compiled['grid_cell_size'] = float(data['grid_cell_size'])
+        logger.debug(f"Loaded compiled geometry with {len(compiled['names'])} polygons from {path}")
+        return compiled
+    except Exception as e:
+        logger.error(f"Error loading compiled geometry from {path}: {str(e)}", exc_info=True)
+        return None
+
+def build_polygon_index(artifact_path, compile_fallback, grid_cell_size):
+    # Prefer the compiled artifact; fall back to parsing the source GeoJSON
+    compiled = load_geometry(artifact_path)
+    if compiled is None:
+        geometries, names = compile_fallback()
+        compiled = {'geometries': geometries, 'names': names}
+    if not len(compiled['geometries']):
+        return None
+    if 'grid' not in compiled and grid_cell_size:
+        compiled['grid'], compiled['grid_origin'] = build_interior_grid(compiled['geometries'], grid_cell_size)
+        compiled['grid_cell_size'] = grid_cell_size
+    return PolygonIndex(**compiled)
+
+def build_state_index():
+    index = build_polygon_index(
+        getattr(settings, 'STATE_GEOMETRY_PATH', None),
+        compile_state_geometry,
+        getattr(settings, 'STATE_GRID_CELL_SIZE', 0)
+    )
+    if index is not None:
+        logger.info(f"Built state index with {len(index)} polygons")
+    return index
+
+
+class LazyPolygonIndex:
+    """Builds a PolygonIndex on first use and keeps it for the life of the process."""
+
+    def __init__(self, builder):
+        self.builder = builder
+        self.index = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.index is None:
+            with self.lock:
+                if self.index is None:
+                    self.index = self.builder()
+        return self.index
+
+
+_state_index = LazyPolygonIndex(build_state_index)
+
+def get_state_index():
+    return _state_index.get()
+
+@functools.lru_cache(maxsize=getattr(settings, 'GEO_LOOKUP_CACHE_SIZE', 4096))
+def _lookup_state_cached(lon, lat):
+    # Only border and out-of-country cells get here; the polygons never change
+    # within a process, so entries need no expiry beyond LRU eviction.
+    return get_state_index().lookup(lon, lat)
+
+def get_state_from_coords(lat, lon):
+    index = get_state_index()
+    if index is None:
+        logger.error("No GeoJSON features loaded")
+        return None
+
+    # Round coordinates to 4 decimal places for consistency; this is also the
+    # grid the lookup cache is keyed on
+    lon, lat = round(float(lon), 4), round(float(lat), 4)
+    state = index.grid_lookup(lon, lat)
+    if state is None:
+        state = _lookup_state_cached(lon, lat)
+    if state:
+        logger.info(f"Found state: {state} for coordinates {lat}, {lon}")
+        return state
     logger.warning(f"No state found for coordinates: {lat}, {lon}")
     return None
 
+def get_states_from_coords(lats, lons):
+    # Batch variant of get_state_from_coords; returns one state (or None) per point
+    index = get_state_index()
+    if index is None:
+        logger.error("No GeoJSON features loaded")
+        return [None] * len(lats)
+    if len(lats) != len(lons):
+        raise ValueError("lats and lons must have the same length")
+    lats = np.round(np.asarray(lats, dtype=float), 4)
+    lons = np.round(np.asarray(lons, dtype=float), 4)
+    return index.lookup_many(lons, lats)
+
 # Load LGA data from JSON file
 lga_json_path = os.path.join(BASE_DIR, 'static', 'nysc', 'json', 'nigeria_lgas.json')
 lgasData = {}
@@ -26,13 +26,21 @@ import logging
 from django.core.exceptions import ObjectDoesNotExist
 import os
 from .utils import lgasData
-from .utils import get_state_from_coords
+from .utils import get_state_from_coords, get_states_from_coords
+from .featured import get_featured_ppas
+from .page_cache import AnonymousPageCacheMixin
+from .search import search_ppas
+from .facets import get_facet_index, ids_to_bitset, selected_facets
+from .duplicates import find_duplicate_ppas
+from .images import THUMBNAIL_FORMATS, ThumbnailNotAllowed, check_thumbnail_request, get_thumbnail, thumbnail_etag
+from .pagination import DEFAULT_ORDERING, CachedCountPaginator, InvalidCursor, cursor_for, cursor_paginate, offset_paginate
 from django.template.loader import render_to_string
 from django.core.cache import cache
 from django.conf import settings
 from django.views.decorators.http import require_POST, require_GET
-from django.db.models import Avg
 from django.views.decorators.cache import never_cache
+from django.http import FileResponse, Http404
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 logger = logging.getLogger(__name__)
 
 
@@ -52,18 +60,9 @@ def check_duplicate_ppa(request):
     if not ppa_name or not ppa_address:
         return JsonResponse({'is_duplicate': False, 'message': 'Name and address are required for duplicate check.'}, status=400)
 
-    # Check for existing PPA with the same name and address (across all users)
-    duplicate_ppa = PPA.objects.filter(
-        name__iexact=ppa_name,
-        address__iexact=ppa_address
-    ).exclude(posted_by=request.user).exists()
-
-    # Check if the current user has already posted this PPA
-    user_duplicate = PPA.objects.filter(
-        name__iexact=ppa_name,
-        address__iexact=ppa_address,
-        posted_by=request.user
-    ).exists()
+    # One index lookup: exact name+address matches anywhere, plus ranked near-matches in the same state/LGA
+    matches = find_duplicate_ppas(ppa_name, ppa_address, ppa_state, ppa_lga)
+    duplicate_ppa, user_duplicate = duplicate_owners(matches, request.user.id)
 
     is_duplicate = duplicate_ppa or user_duplicate
     message = (
@@ -74,9 +73,27 @@ def check_duplicate_ppa(request):
 
     return JsonResponse({
         'is_duplicate': is_duplicate,
-        'message': message
+        'message': message,
+        'matches': [
+            {
+                'id': match.id,
+                'name': match.name,
+                'address': match.address,
+                'state': match.state,
+                'lga': match.lga,
+                'score': match.score,
+                'exact': match.exact,
+                'url': reverse('ppa_detail', args=[match.id]),
+            }
+            for match in matches
+        ]
     })
 
+def duplicate_owners(matches, user_id):
+    """(posted by someone else, posted by this user) for the exact matches in a duplicate lookup."""
+    owner_ids = {match.posted_by_id for match in matches if match.exact}
+    return bool(owner_ids - {user_id}), user_id in owner_ids
+
 @login_required
 def camp_info(request):
     cache_key = 'camp_data'
@@ -288,23 +305,25 @@ def request_ppa_verification(request, ppa_id):
                     'status': 'error',
                     'message': 'A verification request is already pending.'
                 }, status=400)
+            if ppa.verification_status == 'approved':
+                # PPA.save never runs the OCR check for an approved PPA, so a new document would sit unprocessed
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'This PPA is already verified.'
+                }, status=400)
 
             if 'verification_document' in request.FILES:
+                # PPA.save marks it pending and queues the OCR check; poll ppa_verification_status for the result
                 ppa.verification_document = request.FILES['verification_document']
-                ppa.verification_status = 'pending'
                 ppa.save()
 
-                if ppa.verified and ppa.verification_status == 'approved' and ppa.verification_document:
-                    if hasattr(ppa.verification_document, 'path') and os.path.exists(ppa.verification_document.path):
-                        os.remove(ppa.verification_document.path)
-                        ppa.verification_document = None
-                        ppa.save(update_fields=['verification_document'])
-
                 return JsonResponse({
                     'status': 'success',
                     'message': 'Verification request submitted. Processing may take a moment.',
                     'verified': ppa.verified,
-                    'verification_status': ppa.verification_status
+                    'verification_status': ppa.verification_status,
+                    'processing': ppa.verification_processing,
+                    'status_url': reverse('ppa_verification_status', kwargs={'ppa_id': ppa.id})
                 })
             else:
                 return JsonResponse({
@@ -322,6 +341,20 @@ def request_ppa_verification(request, ppa_id):
         'message': 'Invalid request.'
     }, status=400)
 
+@login_required
+@require_GET
+@never_cache
+def ppa_verification_status(request, ppa_id):
+    ppa = get_object_or_404(
+        PPA.objects.only('verified', 'verification_status', 'verification_ocr_status'), id=ppa_id, posted_by=request.user
+    )
+    return JsonResponse({
+        'status': 'success',
+        'verified': ppa.verified,
+        'verification_status': ppa.verification_status,
+        'processing': ppa.verification_processing
+    })
+
 class CustomLoginView(LoginView):
     template_name = 'nysc/login.html'
     authentication_form = EmailAuthenticationForm
@@ -549,110 +582,256 @@ def set_user_state(request):
             return JsonResponse({'status': 'error', 'message': 'An error occurred'}, status=500)
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=405)
 
-class PPAListView(ListView):
+@csrf_exempt
+@login_required
+@require_POST
+def states_from_coords(request):
+    # Batch reverse-geocoding for bulk imports: {"lat": [...], "lon": [...]}
+    try:
+        data = json.loads(request.body.decode('utf-8')) if request.body else {}
+        lats = data.get('lat')
+        lons = data.get('lon')
+        if not isinstance(lats, list) or not isinstance(lons, list):
+            return JsonResponse({'status': 'error', 'message': 'lat and lon must be lists'}, status=400)
+        if len(lats) != len(lons):
+            return JsonResponse({'status': 'error', 'message': 'lat and lon must have the same length'}, status=400)
+        max_points = getattr(settings, 'BATCH_GEOCODE_MAX_POINTS', 10000)
+        if len(lats) > max_points:
+            return JsonResponse({'status': 'error', 'message': f'At most {max_points} points per request'}, status=400)
+        states = get_states_from_coords(lats, lons)
+        logger.info(f"Batch geocoded {len(states)} points for user {request.user.username}")
+        return JsonResponse({'status': 'success', 'states': states})
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON data in states_from_coords: {str(e)}")
+        return JsonResponse({'status': 'error', 'message': 'Invalid request data'}, status=400)
+    except (TypeError, ValueError) as e:
+        logger.error(f"Invalid coordinate values: {str(e)}")
+        return JsonResponse({'status': 'error', 'message': 'Invalid coordinate format'}, status=400)
+    except Exception as e:
+        logger.error(f"Error in states_from_coords: {str(e)}", exc_info=True)
+        return JsonResponse({'status': 'error', 'message': 'An error occurred'}, status=500)
+
+class PPAListView(AnonymousPageCacheMixin, ListView):
     model = PPA
     template_name = 'nysc/ppa_finder.html'
     context_object_name = 'ppas'
     paginate_by = 8
+    page_cache_tags = ('ppa', 'review')
+    page_cache_session_keys = ('user_state',)
+
+    def is_cursor_request(self):
+        # Scroll requests from the finder page carry ?cursor= and skip OFFSET/COUNT pagination.
+        # Text search is ranked by relevance, which has no stable keyset, so it keeps page numbers.
+        return (self.request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+                and 'cursor' in self.request.GET and not self.request.GET.get('q'))
+
+    def get_paginate_by(self, queryset):
+        if self.is_cursor_request():
+            return None
+        return super().get_paginate_by(queryset)
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return CachedCountPaginator(
+            queryset, per_page, orphans=orphans, allow_empty_first_page=allow_empty_first_page,
+            signature=getattr(self, 'filter_signature', None), **kwargs
+        )
 
     def get_queryset(self):
         queryset = PPA.objects.filter(is_approved=True)
         form = PPASearchForm(self.request.GET)
         user_state = self.request.session.get('user_state')
+        # Filters actually applied, normalized; keys the cached paginator count
+        self.filter_signature = {}
 
         logger.debug(f"Session user_state: {user_state}")
         logger.debug(f"Form is valid: {form.is_valid()}")
         logger.debug(f"Raw GET data: {self.request.GET}")
         logger.debug(f"Form errors: {form.errors}")
 
-        if form.is_valid():
-            state = form.cleaned_data.get('state')
-            lga = form.cleaned_data.get('lga')
-            sector = form.cleaned_data.get('sector')
-            min_stipend = form.cleaned_data.get('min_stipend')
-            accommodation = form.cleaned_data.get('accommodation')
-
-            logger.debug(f"Form data: state={state}, lga={lga}, sector={sector}, min_stipend={min_stipend}, accommodation={accommodation}")
-
-            if state:
-                queryset = queryset.filter(state__iexact=state)
-                logger.debug(f"Applied state filter: {state}")
-                if lga and lga != '' and state in lgasData and lga in lgasData[state]:
-                    queryset = queryset.filter(lga__iexact=lga)
-                    logger.debug(f"Applied lga filter: {lga} for state {state}")
-            if sector:
-                queryset = queryset.filter(sector__iexact=sector)
-                logger.debug(f"Applied sector filter: {sector}")
-            if min_stipend and min_stipend != '':
-                stipend_threshold = int(min_stipend)
-                queryset = queryset.filter(stipend__gte=stipend_threshold)
-                logger.debug(f"Applied min_stipend filter: >= {stipend_threshold}")
-            if accommodation:
-                if accommodation == 'yes':
-                    queryset = queryset.filter(accommodation_available=True)
-                    logger.debug(f"Applied accommodation filter: Yes")
-                elif accommodation == 'no':
-                    queryset = queryset.filter(accommodation_available=False)
-                    logger.debug(f"Applied accommodation filter: No")
-        elif user_state and not self.request.GET:
-            queryset = queryset.filter(state__iexact=user_state)
+        submitted = any(name in self.request.GET for name in form.fields)
+        if submitted and form.is_valid():
+            queryset, self.filter_signature = form.filter_queryset(queryset)
+        elif not submitted and user_state:
+            # Filter form not submitted (bare page, or only page/cursor params): default to the visitor's location
+            queryset = queryset.filter(state=user_state)
+            self.filter_signature['state'] = user_state
             logger.debug(f"Applied default user_state filter: {user_state}")
 
-        queryset = queryset.annotate(avg_rating=Avg('reviews__rating'))
-
+        queryset = queryset.select_related('posted_by__profile')
+        if not queryset.ordered:
+            queryset = queryset.order_by(*DEFAULT_ORDERING)
         logger.debug(f"Final queryset: {queryset.query}")
         return queryset
 
+    def get_facet_counts(self, form):
+        if not form.is_valid():
+            return None
+        # Count against the filters get_queryset() actually applied, including the default user_state
+        applied = getattr(self, 'filter_signature', None) or {}
+        restrict_to = None
+        if applied.get('q'):
+            matches = search_ppas(PPA.objects.filter(is_approved=True), form.cleaned_data['q']).order_by().values_list('id', flat=True)
+            restrict_to = ids_to_bitset(matches)
+        return get_facet_index().counts(selected_facets(applied), restrict_to)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         form = PPASearchForm(self.request.GET)
+        if self.request.headers.get('X-Requested-With') != 'XMLHttpRequest':
+            counts = self.get_facet_counts(form)
+            if counts:
+                form.apply_facet_counts(counts)
         context['form'] = form
         context['user_state'] = self.request.session.get('user_state')
         context['states'] = [state[0] for state in PPA.state.field.choices]
 
-        featured_ppas = PPA.objects.filter(
-            is_approved=True
-        ).annotate(avg_rating=Avg('reviews__rating')).filter(avg_rating__gte=4).order_by('-avg_rating')[:3]
-
-        context['featured_ppas'] = featured_ppas
+        context['featured_ppas'] = get_featured_ppas(context['user_state'])
 
         context['page_obj'] = context.get('page_obj')
         context['is_paginated'] = context.get('is_paginated')
         context['paginator'] = context.get('paginator')
+        # Lets the page switch to cursor requests once the first page has rendered
+        page_obj = context['page_obj']
+        context['next_cursor'] = None
+        if page_obj and page_obj.has_next() and not self.request.GET.get('q'):
+            context['next_cursor'] = cursor_for(list(page_obj.object_list)[-1])
 
         if self.request.user.is_authenticated:
-            context['bookmarked_ppa_ids'] = self.request.user.bookmarks.values_list('ppa_id', flat=True)
             context['unread_notification_count'] = self.request.user.notifications.filter(is_read=False).count()
         else:
-            context['bookmarked_ppa_ids'] = []
             context['unread_notification_count'] = 0
 
         return context
 
     def render_to_response(self, context, **response_kwargs):
+        if self.is_cursor_request():
+            try:
+                ppas, next_cursor = cursor_paginate(context['ppas'], self.request.GET.get('cursor'), self.paginate_by)
+            except InvalidCursor as e:
+                logger.warning(f"Rejected PPA finder cursor: {str(e)}")
+                return JsonResponse({'success': False, 'error': 'Invalid cursor'}, status=400)
+            ppas_html = render_to_string('nysc/ppa_card_list.html', {'ppas': ppas}, request=self.request)
+            return JsonResponse({
+                'success': True,
+                'html': ppas_html,
+                'has_next': next_cursor is not None,
+                'next_cursor': next_cursor
+            })
         if self.request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            ppas_html = ''.join([
-                render_to_string('nysc/ppa_card.html', {'ppa': ppa, 'request': self.request})
-                for ppa in context['ppas']
-            ])
+            ppas_html = render_to_string('nysc/ppa_card_list.html', {'ppas': context['ppas']}, request=self.request)
             return JsonResponse({
                 'success': True,
                 'html': ppas_html,
                 'has_previous': context['page_obj'].has_previous(),
                 'has_next': context['page_obj'].has_next(),
                 'current_page': context['page_obj'].number,
-                'total_pages': context['paginator'].num_pages
+                'total_pages': context['paginator'].num_pages,
+                'next_cursor': context['next_cursor']
             })
         return super().render_to_response(context, **response_kwargs)
 
+# Fields /api/ppas/ can return, mapped to the columns they are read from
+API_PPA_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'state': 'state',
+    'lga': 'lga',
+    'sector': 'sector',
+    'stipend': 'stipend',
+    'accommodation_available': 'accommodation_available',
+    'address': 'address',
+    'verified': 'verified',
+    'avg_rating': 'avg_rating',
+    'review_count': 'review_count',
+    'image': 'image',
+    'posted_by': 'posted_by__username',
+    'created_at': 'created_at',
+}
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 50
+
+@require_GET
+def ppa_api(request):
+    """Read-only PPA search: PPASearchForm filters, cursor pagination and ?fields= projection, from .values() rows."""
+    form = PPASearchForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'status': 'error', 'errors': form.errors}, status=400)
+    fields = [name for name in request.GET.get('fields', '').split(',') if name] or list(API_PPA_FIELDS)
+    unknown = [name for name in fields if name not in API_PPA_FIELDS]
+    if unknown:
+        return JsonResponse({'status': 'error', 'message': f"Unknown fields: {', '.join(unknown)}"}, status=400)
+    try:
+        limit = int(request.GET.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= API_MAX_PAGE_SIZE:
+        return JsonResponse({'status': 'error', 'message': f'limit must be between 1 and {API_MAX_PAGE_SIZE}'}, status=400)
+
+    queryset, applied = form.filter_queryset(PPA.objects.filter(is_approved=True))
+    # id and created_at are always read: the keyset cursor is built from them
+    columns = {API_PPA_FIELDS[name] for name in fields} | {'id', 'created_at'}
+    rows = queryset.values(*columns)
+    try:
+        if 'q' in applied:
+            rows, next_cursor = offset_paginate(rows, request.GET.get('cursor'), limit)
+        else:
+            rows, next_cursor = cursor_paginate(rows, request.GET.get('cursor'), limit)
+    except InvalidCursor as e:
+        logger.warning(f"Rejected PPA API cursor: {str(e)}")
+        return JsonResponse({'status': 'error', 'message': 'Invalid cursor'}, status=400)
+
+    storage = PPA._meta.get_field('image').storage
+    results = []
+    for row in rows:
+        item = {name: row[API_PPA_FIELDS[name]] for name in fields}
+        if 'image' in item:
+            item['image'] = storage.url(item['image']) if item['image'] else None
+        results.append(item)
+    return JsonResponse(
+        {'status': 'success', 'results': results, 'next_cursor': next_cursor},
+        json_dumps_params={'separators': (',', ':')}
+    )
+
+THUMBNAIL_MAX_AGE = 60 * 60 * 24 * 365  # URLs embed the source name, which changes whenever the image does
+
+@require_GET
+def thumbnail(request, width, height, name):
+    """Resized PPA image or profile picture, rendered on first request and cached on disk."""
+    storage = PPA._meta.get_field('image').storage
+    fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+    box = (width, height)
+    try:
+        check_thumbnail_request(name, box)
+        etag = thumbnail_etag(storage, name, box, fmt)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = FileResponse(open(get_thumbnail(storage, name, box, fmt), 'rb'), content_type=THUMBNAIL_FORMATS[fmt][1])
+            response['ETag'] = etag
+    except ThumbnailNotAllowed as e:
+        logger.warning(f"Rejected thumbnail request: {str(e)}")
+        raise Http404("Thumbnail size not available")
+    except FileNotFoundError:
+        raise Http404("Image not found")
+    except OSError as e:
+        # A directory, or a file Pillow cannot decode (UnidentifiedImageError is an OSError)
+        logger.warning(f"Cannot render thumbnail of {name}: {str(e)}")
+        raise Http404("Image not found")
+    patch_cache_control(response, public=True, max_age=THUMBNAIL_MAX_AGE, immutable=True)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
 class PPADetailView(LoginRequiredMixin, DetailView):
     model = PPA
     template_name = 'nysc/ppa_detail.html'
     context_object_name = 'ppa'
+    reviews_per_page = 10
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('posted_by__profile')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        ppa = self.get_object()
+        ppa = self.object
         existing_review = ppa.reviews.filter(user=self.request.user).first()
         
         if existing_review and 'edit' in self.request.GET and self.request.GET['edit'] == str(existing_review.id):
@@ -663,10 +842,18 @@ class PPADetailView(LoginRequiredMixin, DetailView):
             context['is_edit'] = False
         
         context['existing_review'] = existing_review
-        if 'review_form' not in context or context['review_form'] is None:
-            print("Warning: review_form is None or not in context!")
 
-        context['bookmarked_ppa_ids'] = self.request.user.bookmarks.values_list('ppa_id', flat=True)
+        # Keyset pages over the (ppa, created_at, id) index: deep pages cost the same as the first,
+        # and the total comes from the stored review_count rather than a COUNT
+        reviews = ppa.reviews.select_related('user__profile')
+        try:
+            context['reviews'], context['next_reviews_cursor'] = cursor_paginate(
+                reviews, self.request.GET.get('reviews_cursor'), self.reviews_per_page
+            )
+        except InvalidCursor as e:
+            logger.warning(f"Bad review cursor for PPA {ppa.id}: {str(e)}")
+            context['reviews'], context['next_reviews_cursor'] = cursor_paginate(reviews, None, self.reviews_per_page)
+        context['is_later_reviews_page'] = bool(self.request.GET.get('reviews_cursor'))
 
         return context
 
@@ -762,15 +949,8 @@ def submit_ppa(request):
             ppa_address = ppa.address.strip()
 
             # Check for duplicates
-            duplicate_ppa = PPA.objects.filter(
-                name__iexact=ppa_name,
-                address__iexact=ppa_address
-            ).exclude(posted_by=request.user).exists()
-            user_duplicate = PPA.objects.filter(
-                name__iexact=ppa_name,
-                address__iexact=ppa_address,
-                posted_by=request.user
-            ).exists()
+            matches = find_duplicate_ppas(ppa_name, ppa_address, ppa.state, ppa.lga)
+            duplicate_ppa, user_duplicate = duplicate_owners(matches, request.user.id)
 
             if duplicate_ppa or user_duplicate:
                 message = 'A PPA with this name and address already exists.' if duplicate_ppa else 'You have already submitted this PPA.'
@@ -64,6 +64,7 @@ INSTALLED_APPS = [
     'social_django',
     'nysc.apps.NyscConfig',
     'sslserver',
+    'background_task',
     
 ]
 
@@ -84,7 +85,13 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
         'LOCATION': BASE_DIR / 'cache',
-    }
+    },
+    # Rendered PPA card fragments; keys embed the PPA/profile version so nothing needs invalidating
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'nysc-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
 }
 
 # Social Django settings
@@ -138,6 +145,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'nysc.context_processors.bookmarks',
             ],
         },
     },
@@ -240,6 +248,30 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# Compiled state polygons used for reverse geocoding.
+# Rebuild with `python manage.py build_state_geometry` after changing the GeoJSON.
+STATE_GEOMETRY_PATH = os.path.join(BASE_DIR, 'static', 'nysc', 'json', 'nigeria_states.npz')
+STATE_GEOMETRY_TOLERANCE = 0.0001  # degrees, roughly 11m
+STATE_GRID_CELL_SIZE = 0.02  # degrees; cells wholly inside a state skip polygon tests
+
+GEO_LOOKUP_CACHE_SIZE = 4096  # LRU entries for points near state borders
+BATCH_GEOCODE_MAX_POINTS = 10000  # per request to /states_from_coords/
+
+FEATURED_PPAS_CACHE_TIMEOUT = 3600  # safety net; review/PPA changes invalidate explicitly
+PPA_COUNT_CACHE_TIMEOUT = 300  # finder paginator counts, per filter signature and catalog version
+PAGE_CACHE_TIMEOUT = 300  # anonymous finder pages; PPA/review changes mark them stale sooner
+PAGE_CACHE_LOCK_TIMEOUT = 30  # how long one worker may hold the rebuild lock for a stale page
+
+IMAGE_PROCESSING_ASYNC = True  # False resizes inline at commit, e.g. for tests and one-off scripts
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv('THUMBNAIL_CACHE_MAX_BYTES', 512 * 1024 * 1024))  # MEDIA_ROOT/thumbs, LRU-evicted
+
+# Image processing and verification OCR run in a separate worker: python manage.py process_tasks
+# (add --queue images or --queue verification to give each its own worker)
+BACKGROUND_TASK_RUN_ASYNC = True
+BACKGROUND_TASK_ASYNC_THREADS = int(os.getenv('TASK_WORKERS', 2))  # concurrent jobs per worker process
+VERIFICATION_OCR_ASYNC = True  # False runs OCR inline at commit, e.g. for tests and one-off scripts
+TESSERACT_CMD = os.getenv('TESSERACT_CMD', r'C:\Program Files\Tesseract-OCR\tesseract.exe' if os.name == 'nt' else '')
+
 
 
 
@@ -552,6 +552,58 @@ $(document).ready(function() {
         $(this).find('input, button').prop('disabled', false); // Reset on hide
     });
 
+    // Reflect a PPA's verification state in whichever card or list item holds its modal
+    function updateVerificationUI(ppaId, response) {
+        const $ppaContainer = $(`#verifyPPA_${ppaId}`).closest('.card, .list-group-item');
+        const $verifiedIcon = $ppaContainer.find('.verified-icon');
+        if (response.verified) {
+            if ($verifiedIcon.length) {
+                $verifiedIcon.show(); // Ensure it's visible
+            } else {
+                $ppaContainer.find('.card-title, a').first().append(
+                    '<i class="fas fa-check-circle text-primary verified-icon" data-bs-toggle="tooltip" data-bs-custom-class="custom-tooltip" title="This PPA is verified"></i>'
+                );
+            }
+            // Reinitialize tooltips globally
+            $('[data-bs-toggle="tooltip"]').tooltip('dispose').each(function() {
+                new bootstrap.Tooltip(this, { customClass: 'custom-tooltip', trigger: 'click' });
+            });
+        } else {
+            $verifiedIcon.hide();
+        }
+        // Update dropdown if present
+        const $dropdown = $ppaContainer.find('.dropdown-menu');
+        if ($dropdown.length) {
+            $dropdown.find(`[data-bs-target="#verifyPPA_${ppaId}"]`).text(
+                response.verification_status === 'approved' ? 'Verified' : 'Pending'
+            ).toggleClass('disabled text-success', response.verification_status === 'approved');
+        }
+    }
+
+    // OCR runs in a background worker; poll until it has read the document (or give up after ~2 minutes)
+    function pollVerificationStatus(ppaId, statusUrl, attempt = 0) {
+        if (attempt >= 40) {
+            console.log('Stopped polling verification status for PPA', ppaId);
+            return;
+        }
+        setTimeout(function() {
+            $.getJSON(statusUrl)
+                .done(function(response) {
+                    if (response.processing) {
+                        pollVerificationStatus(ppaId, statusUrl, attempt + 1);
+                        return;
+                    }
+                    updateVerificationUI(ppaId, response);
+                    if (response.verified) {
+                        window.showCustomModal('Verified', '<p>Your PPA has been verified.</p>');
+                    }
+                })
+                .fail(function(xhr) {
+                    console.log('Verification status poll failed:', xhr.status);
+                });
+        }, 3000);
+    }
+
     // Handle PPA verification request (Updated for dynamic UI update across templates)
     $('form[id^="verifyForm_"]').on('submit', function(e) {
         e.preventDefault();
@@ -577,32 +629,11 @@ $(document).ready(function() {
                 if (response.status === 'success') {
                     window.showCustomModal('Success', `<p>${response.message}</p>`, () => {
                         $(`#verifyPPA_${ppaId}`).modal('hide');
-                        // Update the verified icon dynamically
-                        const $ppaContainer = $(`#verifyPPA_${ppaId}`).closest('.card, .list-group-item');
-                        const $verifiedIcon = $ppaContainer.find('.verified-icon');
-                        if (response.verified) {
-                            if ($verifiedIcon.length) {
-                                $verifiedIcon.show(); // Ensure it's visible
-                            } else {
-                                $ppaContainer.find('.card-title, a').first().append(
-                                    '<i class="fas fa-check-circle text-primary verified-icon" data-bs-toggle="tooltip" data-bs-custom-class="custom-tooltip" title="This PPA is verified"></i>'
-                                );
-                            }
-                            // Reinitialize tooltips globally
-                            $('[data-bs-toggle="tooltip"]').tooltip('dispose').each(function() {
-                                new bootstrap.Tooltip(this, { customClass: 'custom-tooltip', trigger: 'click' });
-                            });
-                        } else {
-                            $verifiedIcon.hide();
-                        }
-                        // Update dropdown if present
-                        const $dropdown = $ppaContainer.find('.dropdown-menu');
-                        if ($dropdown.length) {
-                            $dropdown.find(`[data-bs-target="#verifyPPA_${ppaId}"]`).text(
-                                response.verification_status === 'approved' ? 'Verified' : 'Pending'
-                            ).toggleClass('disabled text-success', response.verification_status === 'approved');
-                        }
+                        updateVerificationUI(ppaId, response);
                     });
+                    if (response.processing && response.status_url) {
+                        pollVerificationStatus(ppaId, response.status_url);
+                    }
                 } else {
                     window.showCustomModal('Error', `<p>${response.message}</p>`);
                 }
@@ -164,6 +164,14 @@ document.addEventListener('DOMContentLoaded', function() {
                         button.innerHTML = button.getAttribute('data-original-html') || 'Submit PPA';
                         return;
                     }
+                    if (data.matches && data.matches.length) {
+                        const similar = data.matches.map(match => `- ${match.name}, ${match.address} (${match.lga}, ${match.state})`).join('\n');
+                        if (!confirm(`Similar PPAs are already listed:\n${similar}\n\nSubmit yours anyway?`)) {
+                            button.disabled = false;
+                            button.innerHTML = button.getAttribute('data-original-html') || 'Submit PPA';
+                            return;
+                        }
+                    }
                     // Proceed with submission if not duplicate
                     const formData = new FormData(form);
 